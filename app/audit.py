@@ -0,0 +1,180 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+from app.blockchain import Blockchain
+
+# Full chain audit. Unlike Blockchain.is_chain_valid, which trusts the hash
+# stored in each block, this recomputes every block hash and merkle root.
+# Those checks are independent per block, so they are spread over a process
+# pool in chunks; only the cheap previous_hash linkage runs sequentially.
+
+DEFAULT_CHUNK_SIZE = 256
+
+# Each worker is a fresh interpreter importing the app, so keep the pool
+# small whatever the host has.
+MAX_WORKERS = 4
+
+_running = threading.Lock()
+
+
+class AuditBusy(Exception):
+    pass
+
+
+def acquire() -> None:
+    """Claim the single audit slot of this process, see release()."""
+    if not _running.acquire(blocking=False):
+        raise AuditBusy("An audit is already running")
+
+
+def release() -> None:
+    _running.release()
+
+
+def available_cpus() -> int:
+    # CPUs we may actually use: the affinity mask, further limited by a
+    # cgroup v2 CPU quota (a Kubernetes CPU limit) when there is one.
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def default_workers() -> int:
+    return min(available_cpus(), MAX_WORKERS)
+
+
+def audit_blocks(blocks: List[Dict], difficulty: str) -> List[Dict]:
+    """Recompute hash, proof of work and merkle root for each block."""
+    errors = []
+    for block in blocks:
+        reasons = []
+        if block.get('pruned'):
+            # Header from a snapshot import: the body needed to recompute
+            # the hash is gone, only the proof of work can be checked.
+            if not isinstance(block.get('hash'), str) or not block['hash'].startswith(difficulty):
+                errors.append({'index': block.get('index'), 'reasons': ["insufficient proof of work"]})
+            continue
+        template = {key: value for key, value in block.items() if key not in ('nonce', 'hash')}
+        try:
+            recomputed = Blockchain.hash_with_nonce(Blockchain.encode_block(template), block['nonce'])
+        except (KeyError, TypeError) as e:
+            recomputed = None
+            reasons.append(f"cannot hash block: {e}")
+
+        if recomputed is not None and recomputed != block.get('hash'):
+            reasons.append("hash mismatch")
+        if not isinstance(block.get('hash'), str) or not block['hash'].startswith(difficulty):
+            reasons.append("insufficient proof of work")
+        if Blockchain.merkle_root(block.get('transactions', [])) != block.get('merkle_root'):
+            reasons.append("merkle root mismatch")
+
+        if reasons:
+            errors.append({'index': block.get('index'), 'reasons': reasons})
+    return errors
+
+
+def audit_linkage(chain: List[Dict]) -> List[Dict]:
+    errors = []
+    for position in range(1, len(chain)):
+        block, previous = chain[position], chain[position - 1]
+        reasons = []
+        if block.get('previous_hash') != previous.get('hash'):
+            reasons.append("previous_hash does not match the previous block")
+        if block.get('index') != previous.get('index', 0) + 1:
+            reasons.append("index is not consecutive")
+        if reasons:
+            errors.append({'index': block.get('index'), 'reasons': reasons})
+    return errors
+
+
+def audit_chain(chain: List[Dict], difficulty: str, workers: Optional[int] = None,
+                chunk_size: int = DEFAULT_CHUNK_SIZE,
+                progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+    started = time.perf_counter()
+    workers = workers or default_workers()
+    chunks = [chain[start:start + chunk_size] for start in range(0, len(chain), chunk_size)]
+    errors: List[Dict] = []
+    done = 0
+
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            errors.extend(audit_blocks(chunk, difficulty))
+            done += len(chunk)
+            if progress:
+                progress(done, len(chain))
+    else:
+        # spawn, not fork: the server process runs threads (chain writer,
+        # executors) that must not be copied mid-operation.
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=context) as pool:
+            futures = {pool.submit(audit_blocks, chunk, difficulty): len(chunk) for chunk in chunks}
+            for future in as_completed(futures):
+                errors.extend(future.result())
+                done += futures[future]
+                if progress:
+                    progress(done, len(chain))
+
+    errors.extend(audit_linkage(chain))
+    errors.sort(key=lambda error: error['index'] if isinstance(error['index'], int) else -1)
+
+    seconds = time.perf_counter() - started
+    return {
+        'valid': not errors,
+        'blocks': len(chain),
+        'errors': errors,
+        'workers': workers,
+        'chunk_size': chunk_size,
+        'seconds': seconds,
+        'blocks_per_second': len(chain) / seconds if seconds > 0 else 0.0,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Recompute every block hash and merkle root of a FastChain chain")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--url', default='http://127.0.0.1:3005', help="node to fetch /blockchain from")
+    source.add_argument('--file', help="JSON file holding a chain (a list of blocks or a /blockchain response)")
+    parser.add_argument('--difficulty', default='00000')
+    parser.add_argument('--workers', type=int, default=None, help="processes to use, defaults to the usable CPUs (at most 4)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.file:
+        with open(args.file) as f:
+            data = json.load(f)
+    else:
+        import httpx
+        data = httpx.get(f"{args.url.rstrip('/')}/blockchain", timeout=60).json()
+    chain = data['chain'] if isinstance(data, dict) else data
+
+    started = time.perf_counter()
+
+    def report_progress(done: int, total: int) -> None:
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        print(f"\raudited {done}/{total} blocks ({rate:.0f} blocks/s)", end='', file=sys.stderr, flush=True)
+
+    report = audit_chain(chain, args.difficulty, args.workers, args.chunk_size, report_progress)
+    print(file=sys.stderr)
+    print(json.dumps(report, indent=2))
+    return 0 if report['valid'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,51 +2,46 @@ import datetime
 import hashlib
 import json
 import copy
+import logging
+import math
+import time
 from typing import Dict, List
 
+from app import constants, metrics, tracing
+from app.mempool import Mempool, MempoolFull
+
+logger = logging.getLogger(__name__)
 
 
 class Blockchain:
     def __init__(self):
         self.chain: List[Dict] = []
         self.difficulty = '00000'
-        self.transactions: List[Dict] = []
-        self.pending_transactions: List[Dict] = []
+        self.mempool = Mempool()
         self.balances: Dict[str, float] = dict()
+        # Set when the node was bootstrapped from a snapshot: blocks up to
+        # base_height are pruned headers and base_balances is the ledger
+        # state at that height.
+        self.base_height = 0
+        self.base_balances: Dict[str, float] = dict()
         self.genesis_block()
-        self.peer_b = copy.deepcopy(self.chain)
         self.mining_reward = 50  
 
     def genesis_block(self) -> None:
-        print("Creating a Genisis Block")
-        block = self.create_block(balances=dict(), previous_hash='0'*64)
+        logger.debug("Loading the Genisis Block")
+        block = copy.deepcopy(constants.GENESIS_BLOCK)
+        template = {key: value for key, value in block.items() if key not in ('nonce', 'hash')}
+        hash_operation = self.hash_with_nonce(self.encode_block(template), block['nonce'])
+        if hash_operation != block['hash'] or not self.meets_difficulty(hash_operation):
+            raise ValueError("Genesis block does not match its proof of work")
         self.chain.append(block)
 
-    def create_block(self, balances: Dict[str, float], previous_hash: str) -> Dict:
-        print("Creating New Block with Previous Hash")
-
-        block = {
-            'index': len(self.chain) + 1,
-            'timestamp': str(datetime.datetime.now()),
-            'transactions': copy.deepcopy(self.transactions),
-            'balances': copy.deepcopy(balances),
-            'previous_hash': previous_hash,
-            'merkle_root': self.calculate_merkle_root(),  
-            'version': '1.0',  
-        }
+    @property
+    def pending_transactions(self) -> List[Dict]:
+        return list(self.mempool)
 
-        nonce, hash = self.hash(block)
-        block['nonce'] = nonce
-        block['hash'] = hash
-        
-       
-        self.transactions = []
-        self.balances = dict()
-        return block
-    
     def clear_pending_transactions(self):
-        self.transactions: List[Dict] = []
-        self.pending_transactions: List[Dict] = []
+        self.mempool.clear()
 
 
     def get_current_balances(self) -> Dict[str, float]:
@@ -54,22 +49,35 @@ class Blockchain:
             return {}
         return copy.deepcopy(self.chain[-1].get('balances', {}))
     
-    def create_block_with_transactions(self, transactions: List[Dict],miner) -> Dict:
+    def create_block_with_transactions(self, transactions: List[Dict],miner, previous_block: Dict = None) -> Dict:
  
-        print("Creating New Block with Transactions")
+        logger.debug("Creating New Block with Transactions")
         
-      
-        previous_hash = self.chain[-1]['hash'] if self.chain else '0'*64
+        block = self.create_block_template(transactions, miner, previous_block)
         
-        print(previous_hash
-              )
+        nonce, hash = self.hash(block)
+        block['nonce'] = nonce
+        block['hash'] = hash
         
-        tx=copy.deepcopy(transactions)
+        return block
+
+    def create_block_template(self, transactions: List[Dict], miner, previous_block: Dict = None) -> Dict:
+        # Everything except nonce and hash, i.e. exactly what gets hashed.
+        # previous_block lets callers build on a snapshot tip instead of the
+        # live chain.
+        if previous_block is None and self.chain:
+            previous_block = self.chain[-1]
+        previous_hash = previous_block['hash'] if previous_block else '0'*64
+        
+        logger.debug("%s", previous_hash)
+        
+        with tracing.span('deepcopy'):
+            tx=copy.deepcopy(transactions)
   
-        block = {
-            'index': len(self.chain) + 1,
+        return {
+            'index': previous_block['index'] + 1 if previous_block else 1,
             'timestamp': str(datetime.datetime.now()),
-            'transactions': copy.deepcopy(transactions),
+            'transactions': tx,
             # 'balances': new_balances,
             'balances':{
                 miner: self.mining_reward
@@ -78,48 +86,45 @@ class Blockchain:
             'merkle_root': self.calculate_merkle_root_for_block(tx),
             'version': '1.0',
         }
-        
-        nonce, hash = self.hash(block)
-        block['nonce'] = nonce
-        block['hash'] = hash
-        
-        return block
     
     def hash(self, block: Dict) -> tuple:
-        print("Hashing and Finding Nanunce")
-        encoded_block = json.dumps(block, sort_keys=True).encode()
+        logger.debug("Hashing and Finding Nanunce")
+        started = time.perf_counter()
+        encoded_block = self.encode_block(block)
         nonce = 0
-        while True:
-            hash_operation = hashlib.sha256(encoded_block + str(nonce).encode()).hexdigest()
-            if hash_operation[:len(self.difficulty)] == self.difficulty:
-                break
-            nonce += 1
+        with tracing.span('pow.nonce_loop'):
+            while True:
+                hash_operation = self.hash_with_nonce(encoded_block, nonce)
+                if self.meets_difficulty(hash_operation):
+                    break
+                nonce += 1
+
+        elapsed = time.perf_counter() - started
+        metrics.NONCE_ATTEMPTS.inc(nonce + 1)
+        metrics.POW_SECONDS.observe(elapsed)
+        if elapsed > 0:
+            metrics.HASH_RATE.set((nonce + 1) / elapsed)
         return nonce, hash_operation
 
-    def calculate_merkle_root(self) -> str:
-    
-        if not self.transactions:
-            print("txn not found so creating from exmpty")
-            return hashlib.sha256(''.encode()).hexdigest()
-        
-        hash_list = [hashlib.sha256(json.dumps(tx, sort_keys=True).encode()).hexdigest() 
-                    for tx in self.transactions]
-        
-        while len(hash_list) > 1:
-            if len(hash_list) % 2 != 0:
-                hash_list.append(hash_list[-1])
-            hash_list = [hashlib.sha256((hash_list[i] + hash_list[i+1]).encode()).hexdigest()   
-                        for i in range(0, len(hash_list), 2)]
-        print("Final Mekkal ROot Hash",hash_list)
-        return hash_list[0]
+    @staticmethod
+    def encode_block(block: Dict) -> bytes:
+        return json.dumps(block, sort_keys=True).encode()
+
+    @staticmethod
+    def hash_with_nonce(encoded_block: bytes, nonce: int) -> str:
+        return hashlib.sha256(encoded_block + str(nonce).encode()).hexdigest()
+
+    def meets_difficulty(self, hash_operation: str, difficulty: str = None) -> bool:
+        difficulty = self.difficulty if difficulty is None else difficulty
+        return hash_operation[:len(difficulty)] == difficulty
 
     def get_previous_block(self) -> Dict:
-        print("Getting Previous Hash")
+        logger.debug("Getting Previous Hash")
         return self.chain[-1]
     
     
     def add_transaction(self, sender: str, receiver: str, amount: float) -> int:
-        print("Adding Txn in Pending ")
+        logger.debug("Adding Txn in Pending ")
         transaction = {
             'sender': sender,
             'receiver': receiver,
@@ -127,20 +132,40 @@ class Blockchain:
             'timestamp': str(datetime.datetime.now()),
             'signature': ''  #TODO Adding Sign
         }
-        print(transaction)
-        
+        logger.debug("%s", transaction)
+        return self.admit_transaction(transaction)
+
+    def admit_transaction(self, transaction: Dict) -> int:
+        # Adds an already built transaction (local or relayed by a peer) to
+        # the pending pool as is, so it keeps its id across nodes. Raises
+        # MempoolFull when admission control turns it away.
+        # Expire first so stale transactions neither hold the sender's
+        # funds nor take a slot, whether or not this one gets in.
+        self.expire_pending()
+        # Relayed transactions are untrusted: a NaN amount passes every
+        # balance comparison and would poison the sender's pending total.
+        if not self.well_formed_transaction(transaction):
+            return -1
+        tx_id = self.transaction_id(transaction)
+        if tx_id in self.mempool:
+            return -1
         if self.validate_transaction(transaction):
-            self.transactions.append(transaction)
-            self.pending_transactions.append(transaction)
+            self.mempool.add(tx_id, transaction)
             previous_block = self.get_previous_block()
             return previous_block['index'] + 1
         return -1
 
+    @staticmethod
+    def transaction_id(transaction: Dict) -> str:
+        # Same per transaction hash the merkle root is built from.
+        return hashlib.sha256(json.dumps(transaction, sort_keys=True).encode()).hexdigest()
+
     def validate_transaction(self, transaction: Dict) -> bool:
-        print("Validating the txn")
+        logger.debug("Validating the txn")
       
-        sender_balance = self.get_balance(transaction['sender'])
-        sender_pending = self.get_pending_outgoing_amount(transaction['sender'])
+        with tracing.span('validate_transaction.balance_scan'):
+            sender_balance = self.get_balance(transaction['sender'])
+            sender_pending = self.get_pending_outgoing_amount(transaction['sender'])
 
         available_balance = sender_balance - sender_pending
 
@@ -153,10 +178,10 @@ class Blockchain:
         return True
 
     def get_balance(self, address: str) -> (float):
-        print("Find the Balance of user")
-        balance = 0
+        logger.debug("Find the Balance of user")
+        balance = self.base_balances.get(address, 0)
      
-        for block in self.chain:
+        for block in self.chain[self.base_height:]:
       
             if address in block['balances']:
                 balance += block['balances'][address]
@@ -170,47 +195,56 @@ class Blockchain:
         return balance
     
     def get_pending_outgoing_amount(self, address: str) -> float:
+        return self.mempool.outgoing(address)
+
+    def expire_pending(self) -> int:
+        # Drops pending transactions past the mempool TTL.
+        return len(self.mempool.expire())
+
+    def create_credit_block(self, receiver: str, amount: float, previous_block: Dict = None) -> Dict:
+        # /add: a block without transactions that mints ``amount`` to
+        # ``receiver``. It is mined and gossiped like any other block, so
+        # every node sees the same credit and can verify it.
+        logger.debug("Creating credit block for %s", receiver)
+        block = self.create_block_template([], receiver, previous_block)
+        block['balances'] = {receiver: amount}
+        block['nonce'], block['hash'] = self.hash(block)
+        return block
 
-        try:
-             pending_amount = sum(
-                 tx['amount'] for tx in self.pending_transactions 
-                 if tx['sender'] == address
-              )
-             return pending_amount
-        except Exception as e:
-               print(f"Error calculating pending amount: {str(e)}")
-               return 0.0
-
-    def add_balance(self, receiver: str, amount: float) -> int:
-         print("Adding balance to an address")
-    
-         previous_block = self.get_previous_block()
-         print(previous_block)
+    def hack_block(self, block_id: int) -> Dict:
+        # Tampers with a block for testing, replacing it rather than editing
+        # the published one. The stored hash is kept, so the block no longer
+        # matches it; no proof of work runs on the writer. Published
+        # snapshots share the block list, so swap in a copy of it too.
+        self.chain = list(self.chain)
+        block = copy.copy(self.chain[block_id])
+        block['timestamp'] = str(datetime.datetime.now())
+        self.chain[block_id] = block
+        return block
 
-         if 'balances' not in previous_block:
-             previous_block['balances'] = {}
+    @staticmethod
+    def apply_block_to_ledger(ledger: Dict[str, float], block: Dict) -> None:
+        # Same accounting as get_balance, applied to every address at once.
+        for address, amount in block['balances'].items():
+            ledger[address] = ledger.get(address, 0) + amount
+        for tx in block['transactions']:
+            ledger[tx['sender']] = ledger.get(tx['sender'], 0) - tx['amount']
+            ledger[tx['receiver']] = ledger.get(tx['receiver'], 0) + tx['amount']
     
-         if receiver not in previous_block['balances']:
 
-              previous_block['balances'][receiver] = 0
-    
-         previous_block['balances'][receiver] += amount
-         return (previous_block['balances'])
-    
+    def is_chain_valid(self, chain: List[Dict] = None) -> bool:
+        with tracing.span('is_chain_valid'), metrics.BLOCK_VALIDATION_SECONDS.time(check='chain'):
+            return self._is_chain_valid(self.chain if chain is None else chain)
 
-    def is_chain_valid(self) -> bool:
-        print("Checking Chain Validation")
-        previous_block = self.chain[0]
+    def _is_chain_valid(self, chain: List[Dict]) -> bool:
+        logger.debug("Checking Chain Validation")
+        previous_block = chain[0]
         block_index = 1
        
-        print("Start Peer")
-        print(self.peer_b)
-        print("End Peer") 
-        
     
-        while block_index < len(self.chain):
-            block = self.chain[block_index]
-            print("Block =",block)
+        while block_index < len(chain):
+            block = chain[block_index]
+            logger.debug("Block = %s", block)
 
             if block['previous_hash'] != previous_block['hash']:
                 return False
@@ -223,12 +257,17 @@ class Blockchain:
             if block['hash'][:len(self.difficulty)] != self.difficulty:
                 return False
 
+            if block.get('pruned'):
+                previous_block = block
+                block_index += 1
+                continue
+
             calculated_merkle = self.calculate_merkle_root_for_block(block['transactions'])
             
             if block['merkle_root'] != calculated_merkle:
-                     print(f"Invalid merkle root at block {block_index}")
-                     print(f"Stored: {block['merkle_root']}")
-                     print(f"Calculated: {calculated_merkle}")
+                     logger.warning("Invalid merkle root at block %s", block_index)
+                     logger.warning("Stored: %s", block['merkle_root'])
+                     logger.warning("Calculated: %s", calculated_merkle)
                      return False
             
 
@@ -241,6 +280,11 @@ class Blockchain:
         return True
     
     def calculate_merkle_root_for_block(self, transactions: List[Dict]) -> str:
+        with tracing.span('merkle_root'), metrics.MERKLE_SECONDS.time():
+            return self.merkle_root(transactions)
+
+    @staticmethod
+    def merkle_root(transactions: List[Dict]) -> str:
  
         if not transactions:
             return hashlib.sha256(''.encode()).hexdigest()
@@ -252,37 +296,50 @@ class Blockchain:
             for tx in transactions
         ]
     
-        print("Initial transaction hashes:")
-        for i, h in enumerate(hash_list):
-            print(f"Tx {i}: {h}")
+        # Per hash tracing is only worth its cost when explicitly enabled.
+        trace = logger.isEnabledFor(logging.DEBUG)
+        if trace:
+            logger.debug("Initial transaction hashes:")
+            for i, h in enumerate(hash_list):
+                logger.debug("Tx %s: %s", i, h)
         while len(hash_list) > 1:
-            print(f"Current hash list length: {len(hash_list)}")
+            if trace:
+                logger.debug("Current hash list length: %s", len(hash_list))
             if len(hash_list) % 2 != 0:
                 hash_list.append(hash_list[-1])
-                print("Added duplicate of last hash for even number")
+                logger.debug("Added duplicate of last hash for even number")
         
             new_hash_list = []
             for i in range(0, len(hash_list), 2):
                 combined = hash_list[i] + hash_list[i+1]
                 new_hash = hashlib.sha256(combined.encode()).hexdigest()
                 new_hash_list.append(new_hash)
-                print(f"Combined {hash_list[i][:8]}... + {hash_list[i+1][:8]}... = {new_hash[:8]}...")
+                if trace:
+                    logger.debug("Combined %s... + %s... = %s...", hash_list[i][:8], hash_list[i+1][:8], new_hash[:8])
         
             hash_list = new_hash_list
     
-        print(f"Final merkle root: {hash_list[0]}")
+        logger.debug("Final merkle root: %s", hash_list[0])
         return hash_list[0]
 
 
     def is_valid_block(self, block: Dict) -> bool:
-     print("Validating Block Before adding to Chain")
+        with tracing.span('is_valid_block'), metrics.BLOCK_VALIDATION_SECONDS.time(check='block'):
+            return self._is_valid_block(block)
+
+    def _is_valid_block(self, block: Dict) -> bool:
+     logger.debug("Validating Block Before adding to Chain")
  
+     # Pruned headers only ever come from a verified snapshot import.
+     if block.get('pruned'):
+        return False
+
      prev_block = self.get_previous_block()
      if block['previous_hash'] != prev_block['hash']:
         return False
         
-     print("Verfying Proof Of work i.e 00000")
-     if block['hash'][:len(self.difficulty)] != self.difficulty:
+     logger.debug("Verfying Proof Of work i.e 00000")
+     if not self.verify_block_contents(block):
             return False
         
    
@@ -292,30 +349,200 @@ class Blockchain:
             
      return True
 
+    @staticmethod
+    def well_formed_transaction(transaction) -> bool:
+        return (
+            isinstance(transaction, dict)
+            and isinstance(transaction.get('sender'), str)
+            and isinstance(transaction.get('receiver'), str)
+            and isinstance(transaction.get('amount'), (int, float))
+            and not isinstance(transaction.get('amount'), bool)
+            and math.isfinite(transaction['amount'])
+        )
+
+    def verify_block_contents(self, block: Dict) -> bool:
+        # What a block claims about itself, checked without trusting it: the
+        # hash is recomputed over its contents and must meet the difficulty,
+        # the merkle root must match its transactions and it may only mint
+        # the mining reward to one address, or any amount to one address if
+        # it is a credit block without transactions.
+        template = {key: value for key, value in block.items() if key not in ('nonce', 'hash')}
+        try:
+            hash_operation = self.hash_with_nonce(self.encode_block(template), block['nonce'])
+            merkle_root = self.merkle_root(block['transactions'])
+        except (KeyError, TypeError, ValueError):
+            return False
+        if not all(self.well_formed_transaction(tx) for tx in block['transactions']):
+            logger.info("Block %s has malformed transactions", block.get('index'))
+            return False
+        if hash_operation != block.get('hash') or not self.meets_difficulty(hash_operation):
+            logger.info("Block %s hash does not match its contents", block.get('index'))
+            return False
+        if merkle_root != block.get('merkle_root'):
+            logger.info("Block %s merkle root does not match its transactions", block.get('index'))
+            return False
+        balances = block.get('balances')
+        if not isinstance(balances, dict) or len(balances) != 1:
+            logger.info("Block %s does not mint to exactly one address", block.get('index'))
+            return False
+        (minted,) = balances.values()
+        if block['transactions']:
+            if minted != self.mining_reward:
+                logger.info("Block %s mints more than the mining reward", block.get('index'))
+                return False
+        elif not (isinstance(minted, (int, float)) and not isinstance(minted, bool)
+                  and math.isfinite(minted) and minted > 0):
+            logger.info("Block %s credits an invalid amount", block.get('index'))
+            return False
+        return True
+
     def get_pending_transactions(self) -> List[Dict]:
-        print("Getting Pending Txn")
-        print(self.pending_transactions)
+        logger.debug("Getting Pending Txn")
+        logger.debug("%s", self.pending_transactions)
         return self.pending_transactions
     
 
     def remove_pending_transaction(self, transaction: Dict) -> None:
-        print("Adding txn in Block rempving from Prnding")
-        if transaction in self.pending_transactions:
-            self.pending_transactions.remove(transaction)
+        logger.debug("Adding txn in Block rempving from Prnding")
+        self.mempool.remove(self.transaction_id(transaction))
 
+    def append_block(self, block: Dict) -> bool:
+        if not self.is_valid_block(block):
+            return False
+        self.chain.append(block)
+        for tx in block['transactions']:
+            self.remove_pending_transaction(tx)
+        return True
+
+
+    @staticmethod
+    def block_header(block: Dict) -> Dict:
+        # What a snapshot keeps of a block below its height.
+        return {key: value for key, value in block.items() if key not in ('transactions', 'balances', 'pruned')}
+
+    @staticmethod
+    def state_hash(balances: Dict[str, float]) -> str:
+        # Content address of a ledger state, independent of dict order.
+        encoded = json.dumps(sorted(balances.items()), separators=(',', ':'))
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    @classmethod
+    def snapshot_hash(cls, height: int, headers: List[Dict], balances: Dict[str, float]) -> str:
+        # Pins a whole snapshot: the height, every header up to it (and so the
+        # tip) and the ledger state there.
+        headers_digest = hashlib.sha256(
+            json.dumps(headers, sort_keys=True, separators=(',', ':')).encode()
+        ).hexdigest()
+        encoded = json.dumps([height, headers_digest, cls.state_hash(balances)])
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    def import_snapshot(self, manifest: Dict, headers: List[Dict], balances: Dict[str, float],
+                        expected_hash: str) -> bool:
+        """Adopt a snapshot taken at ``manifest['height']`` on a fresh node.
+
+        Headers carry no transactions or balances, so their hashes cannot be
+        recomputed and the balances are not implied by them. The snapshot is
+        therefore trusted only if it matches ``expected_hash``, a
+        ``snapshot_hash`` obtained out of band from a node the operator
+        trusts. Blocks after the snapshot height are then appended and
+        verified as usual.
+        """
+        logger.info("Importing snapshot at height %s", manifest.get('height'))
+        if len(self.chain) != 1:
+            logger.info("Snapshot rejected: chain already has blocks")
+            return False
+        if not expected_hash:
+            logger.info("Snapshot rejected: no trusted snapshot hash to check it against")
+            return False
+
+        height = manifest['height']
+        if len(headers) != height or not headers or headers[-1]['hash'] != manifest['tip_hash']:
+            logger.info("Snapshot rejected: headers do not end at the advertised tip")
+            return False
+        if headers[0] != self.block_header(self.chain[0]):
+            logger.info("Snapshot rejected: different genesis block")
+            return False
+
+        for previous, header in zip(headers, headers[1:]):
+            if header['previous_hash'] != previous['hash'] or header['index'] != previous['index'] + 1:
+                logger.info("Snapshot rejected: header chain broken at %s", header['index'])
+                return False
+
+        if self.snapshot_hash(height, headers, balances) != expected_hash:
+            logger.info("Snapshot rejected: does not match the trusted snapshot hash")
+            return False
+
+        pruned = [dict(header, transactions=[], balances={}, pruned=True) for header in headers[1:]]
+        self.chain = self.chain[:1] + pruned
+        self.base_height = height
+        self.base_balances = dict(balances)
+        self.mempool.clear()
+        return True
 
     def resolve_conflicts(self, new_chain: List[Dict]) -> bool:
-        print("Resolve Longer chain")
+        logger.debug("Resolve Longer chain")
         if len(new_chain) <= len(self.chain):
            return False
-        
 
-        for i in range(1, len(new_chain)):
-          if not self.is_valid_block(new_chain[i]):
-              print("Chain not valid")
-              return False
+        fork_height = 0
+        for ours, theirs in zip(self.chain, new_chain):
+            if not isinstance(theirs, dict) or ours['hash'] != theirs.get('hash'):
+                break
+            fork_height += 1
+
+        return self.reorganize(fork_height, new_chain[fork_height:])
+
+    def reorganize(self, fork_height: int, blocks: List[Dict]) -> bool:
+        """Switch to ``blocks``, built on our block at ``fork_height``.
+
+        Only done when it makes the chain longer. Every new block is checked
+        in full and its transactions are replayed against the ledger at the
+        fork point. Transactions of the blocks we drop go back to the pool
+        if they are still valid.
+        """
+        if not blocks or fork_height + len(blocks) <= len(self.chain):
+            return False
+        if not max(self.base_height, 1) <= fork_height <= len(self.chain):
+            logger.info("Fork at height %s is below what we can validate", fork_height)
+            return False
 
-        print("Accepting New Chain")
-        self.chain = new_chain
+        ledger = dict(self.base_balances)
+        for block in self.chain[self.base_height:fork_height]:
+            self.apply_block_to_ledger(ledger, block)
+
+        previous = self.chain[fork_height - 1]
+        for block in blocks:
+            if (not isinstance(block, dict) or block.get('pruned')
+                    or block.get('previous_hash') != previous['hash']
+                    or block.get('index') != previous['index'] + 1
+                    or not self.verify_block_contents(block)):
+                logger.info("Chain not valid at height %s", previous['index'] + 1)
+                return False
+            for address, amount in block['balances'].items():
+                ledger[address] = ledger.get(address, 0) + amount
+            for tx in block['transactions']:
+                if tx['amount'] <= 0 or ledger.get(tx['sender'], 0) < tx['amount']:
+                    logger.info("Chain not valid: overspend in block %s", block['index'])
+                    return False
+                ledger[tx['sender']] -= tx['amount']
+                ledger[tx['receiver']] = ledger.get(tx['receiver'], 0) + tx['amount']
+            previous = block
+
+        logger.info("Accepting New Chain, fork at height %s", fork_height)
+        dropped = [tx for block in self.chain[fork_height:] for tx in block['transactions']]
+        self.chain = self.chain[:fork_height] + list(blocks)
+        self._readmit(dropped, blocks)
         return True
+
+    def _readmit(self, dropped: List[Dict], blocks: List[Dict]) -> None:
+        confirmed = {self.transaction_id(tx) for block in blocks for tx in block['transactions']}
+        candidates = dropped + list(self.mempool)
+        self.mempool.clear()
+        for tx in candidates:
+            if self.transaction_id(tx) in confirmed:
+                continue
+            try:
+                self.admit_transaction(tx)
+            except MempoolFull:
+                pass
     
@@ -0,0 +1,140 @@
+import json
+import logging
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.blockchain import Blockchain
+from app.chainActor import ChainActor, ChainSnapshot
+
+logger = logging.getLogger(__name__)
+
+# Fast bootstrap. A new node downloads the ledger state at some height H
+# together with the block headers up to H and then fetches only the full
+# blocks after H, which are verified as usual.
+#
+# Headers carry no transactions or balances, so nothing in them can be
+# recomputed. The snapshot is trusted because it matches a snapshot_hash
+# the operator got from a node they trust for a given height
+# (BOOTSTRAP_HEIGHT and BOOTSTRAP_SNAPSHOT_HASH), in the spirit of a
+# checkpoint. Without one, bootstrap refuses to run.
+#
+# GET /snapshot streams newline delimited JSON:
+#   {"type": "manifest", height, tip_hash, state_hash, snapshot_hash,
+#    difficulty, headers, accounts}
+#   {"type": "header", "header": {...}}      one per block, genesis first
+#   {"type": "account", "address", "balance"} one per nonzero balance
+
+BLOCKS_PAGE_SIZE = 500
+
+# Catch-up after the snapshot stops after this many pages; anything left is
+# synced by peers once the node is ready.
+MAX_CATCH_UP_PAGES = 20
+
+REQUEST_TIMEOUT = 10
+
+_cache_lock = threading.Lock()
+_cache: Dict[Tuple[int, str], Tuple[Dict, List[bytes]]] = {}
+
+
+class BootstrapError(Exception):
+    pass
+
+
+def build_snapshot(snapshot: ChainSnapshot, height: int, difficulty: str) -> Tuple[Dict, List[bytes]]:
+    """Manifest and encoded lines of the snapshot at ``height``.
+
+    The result only depends on the blocks up to ``height``, so it is cached
+    by height and block hash and shared by every node bootstrapping from us.
+    """
+    key = (height, snapshot.chain[height - 1]['hash'])
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None:
+        return cached
+
+    headers = [Blockchain.block_header(block) for block in snapshot.chain[:height]]
+    accounts = snapshot.transfers.state(height)
+    manifest = {
+        'type': 'manifest',
+        'height': height,
+        'tip_hash': key[1],
+        'state_hash': Blockchain.state_hash(accounts),
+        'snapshot_hash': Blockchain.snapshot_hash(height, headers, accounts),
+        'difficulty': difficulty,
+        'headers': len(headers),
+        'accounts': len(accounts),
+    }
+
+    lines = [json.dumps(manifest).encode() + b"\n"]
+    lines.extend(json.dumps({'type': 'header', 'header': header}).encode() + b"\n" for header in headers)
+    lines.extend(
+        json.dumps({'type': 'account', 'address': address, 'balance': balance}).encode() + b"\n"
+        for address, balance in sorted(accounts.items())
+    )
+
+    with _cache_lock:
+        # Only the latest snapshot is worth keeping.
+        _cache.clear()
+        _cache[key] = (manifest, lines)
+    return manifest, lines
+
+
+def parse_snapshot(lines: Iterator[str]) -> Tuple[Dict, List[Dict], Dict[str, float]]:
+    manifest, headers, accounts = None, [], {}
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        kind = record.get('type')
+        if kind == 'manifest':
+            manifest = record
+        elif kind == 'header':
+            headers.append(record['header'])
+        elif kind == 'account':
+            accounts[record['address']] = record['balance']
+
+    if manifest is None:
+        raise BootstrapError("Snapshot has no manifest")
+    if len(headers) != manifest['headers'] or len(accounts) != manifest['accounts']:
+        raise BootstrapError("Snapshot is truncated")
+    return manifest, headers, accounts
+
+
+async def bootstrap(actor: ChainActor, blockchain: Blockchain, url: str, height: int, snapshot_hash: str) -> int:
+    """Import the snapshot at ``height`` served by the node at ``url``, then catch up.
+
+    ``snapshot_hash`` is the trusted hash the snapshot must match.
+    Returns the height reached.
+    """
+    import httpx
+
+    if not snapshot_hash or height <= 0:
+        raise BootstrapError("A snapshot height and its trusted hash are required to bootstrap")
+
+    url = url.rstrip('/')
+    async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT) as client:
+        async with client.stream('GET', f"{url}/snapshot", params={'height': height}) as response:
+            response.raise_for_status()
+            lines = [line async for line in response.aiter_lines()]
+        manifest, headers, accounts = parse_snapshot(lines)
+
+        if manifest['difficulty'] != blockchain.difficulty:
+            raise BootstrapError(f"Snapshot difficulty {manifest['difficulty']} does not match ours")
+        if not await actor.execute(blockchain.import_snapshot, manifest, headers, accounts, snapshot_hash):
+            raise BootstrapError("Snapshot failed verification")
+        logger.info("Imported snapshot at height %s with %s accounts", manifest['height'], len(accounts))
+
+        height = manifest['height']
+        for _ in range(MAX_CATCH_UP_PAGES):
+            response = await client.get(f"{url}/blocks", params={'start': height, 'limit': BLOCKS_PAGE_SIZE})
+            response.raise_for_status()
+            blocks = response.json()['blocks']
+            if not blocks:
+                break
+            for block in blocks:
+                if not await actor.execute(blockchain.append_block, block):
+                    raise BootstrapError(f"Block {block.get('index')} after the snapshot is invalid")
+            height += len(blocks)
+
+    logger.info("Bootstrapped to height %s from %s", height, url)
+    return height
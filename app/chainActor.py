@@ -0,0 +1,192 @@
+import asyncio
+import contextvars
+import functools
+import itertools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Awaitable, Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from app import tracing
+from app.blockchain import Blockchain
+from app.ledger import TransferStore, TransferView
+
+logger = logging.getLogger(__name__)
+
+
+class ChainView(Sequence):
+    """Read-only first ``length`` blocks of the writer's block list.
+
+    Publishing a snapshot is O(1): the view shares the list, which the
+    writer only ever appends to or swaps for a new one.
+    """
+    __slots__ = ('blocks', '_length')
+
+    def __init__(self, blocks: List[Dict]):
+        self.blocks = blocks
+        self._length = len(blocks)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self.blocks[slice(*index.indices(self._length))])
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('chain index out of range')
+        return self.blocks[index]
+
+    def __iter__(self) -> Iterator[Dict]:
+        return itertools.islice(self.blocks, self._length)
+
+
+@dataclass(frozen=True)
+class ChainSnapshot:
+    """Immutable view of the chain published after every write.
+
+    Blocks inside ``chain`` are shared with the writer, which never mutates a
+    block once it has been published (it replaces it with a copy instead).
+    """
+    version: int
+    chain: ChainView
+    pending: Tuple[Dict, ...]
+    balances: Mapping[str, float]
+    transfers: TransferView
+
+    @property
+    def tip(self) -> Dict:
+        return self.chain[-1]
+
+    @property
+    def height(self) -> int:
+        return len(self.chain)
+
+
+# Listeners are awaited by the writer loop before the next command runs, so
+# they must not wait on the network: queue outgoing messages with
+# put_nowait and let a per connection task do the sending.
+Listener = Callable[[ChainSnapshot, ChainSnapshot], Awaitable[None]]
+
+
+class ChainActor:
+    """Single writer for the blockchain.
+
+    Every mutation is queued as a command and executed one at a time on a
+    dedicated thread, so the event loop keeps serving reads while a write
+    runs. Readers use ``snapshot`` and never take a lock.
+    """
+
+    def __init__(self, blockchain: Blockchain):
+        self.blockchain = blockchain
+        self.listeners: List[Listener] = []
+        self._transfers = TransferStore()
+        self._base_height = blockchain.base_height
+        self.snapshot = self._build_snapshot(None)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chain-writer')
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=False)
+
+    async def execute(self, command: Callable, *args, **kwargs):
+        """Queue ``command(*args, **kwargs)`` and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+        # Run the command in the caller's context so its trace spans land
+        # on the request that queued it.
+        context = contextvars.copy_context()
+        name = getattr(command, '__name__', 'command')
+        await self._queue.put((functools.partial(context.run, self._traced, name, command, *args, **kwargs), future))
+        return await future
+
+    @staticmethod
+    def _traced(name: str, command: Callable, *args, **kwargs):
+        with tracing.span(f'writer.{name}'):
+            return command(*args, **kwargs)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            command, future = await self._queue.get()
+            previous = self.snapshot
+            try:
+                result, error, self.snapshot = await loop.run_in_executor(
+                    self._executor, self._apply, command, previous
+                )
+            except Exception as e:
+                result, error = None, e
+
+            if not future.cancelled():
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+            if self.snapshot is not previous:
+                for listener in self.listeners:
+                    try:
+                        await listener(previous, self.snapshot)
+                    except Exception:
+                        logger.exception("Chain listener failed")
+
+    def _apply(self, command: Callable, previous: ChainSnapshot) -> tuple:
+        result, error = None, None
+        try:
+            result = command()
+        except Exception as e:
+            error = e
+        # Publish even after a failed command, it may have changed state
+        # before raising.
+        return result, error, self._build_snapshot(previous)
+
+    def _build_snapshot(self, previous: Optional[ChainSnapshot]) -> ChainSnapshot:
+        chain = ChainView(self.blockchain.chain)
+
+        # Published blocks are never mutated, so the previous tip still at
+        # its height means everything below it is unchanged too. A snapshot
+        # import keeps genesis but replaces the ledger it starts from, so it
+        # never counts as an extension.
+        extends_previous = (
+            previous is not None
+            and self.blockchain.base_height == self._base_height
+            and len(chain) >= previous.height
+            and chain[previous.height - 1] is previous.tip
+        )
+        if extends_previous and len(chain) == previous.height:
+            balances = previous.balances
+            transfers = previous.transfers
+        else:
+            # Copy on write: only the ledger of a changed chain is rebuilt,
+            # and only from the first new block when the chain was extended.
+            ledger = dict(previous.balances) if extends_previous else dict(self.blockchain.base_balances)
+            if not extends_previous:
+                self._transfers = TransferStore()
+                self._base_height = self.blockchain.base_height
+                if self.blockchain.base_height:
+                    self._transfers.append_state(self.blockchain.base_balances, self.blockchain.base_height)
+            for block in chain[previous.height if extends_previous else 0:]:
+                Blockchain.apply_block_to_ledger(ledger, block)
+                self._transfers.append_block(block)
+            balances = MappingProxyType(ledger)
+            transfers = self._transfers.view()
+
+        return ChainSnapshot(
+            version=previous.version + 1 if previous is not None else 0,
+            chain=chain,
+            pending=tuple(self.blockchain.pending_transactions),
+            balances=balances,
+            transfers=transfers,
+        )
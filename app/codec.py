@@ -0,0 +1,191 @@
+import json
+import zlib
+from typing import Dict
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+try:
+    import msgpack
+except ImportError:  # optional, falls back to json framing
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # optional, falls back to deflate
+    zstandard = None
+
+
+# Block fields that always carry a 64 char sha256 hex digest. In binary
+# framing they travel as the raw 32 bytes instead.
+HASH_FIELDS = ('hash', 'previous_hash', 'merkle_root')
+
+# Payloads smaller than this are not worth compressing.
+COMPRESSION_THRESHOLD = 1024
+
+# Largest payload a client frame may decompress to. Compressed frames are
+# inflated incrementally and rejected past this, so a small frame cannot
+# expand beyond the pod's memory limit.
+MAX_DECOMPRESSED_SIZE = 8 * 1024 * 1024
+
+# First byte of every binary frame says how the rest is compressed.
+FRAME_RAW = 0x00
+FRAME_DEFLATE = 0x01
+FRAME_ZSTD = 0x02
+
+
+def available_encodings() -> list:
+    encodings = ['json']
+    if msgpack is not None:
+        encodings.append('msgpack')
+    return encodings
+
+
+def available_compressions() -> list:
+    compressions = ['none', 'deflate']
+    if zstandard is not None:
+        compressions.append('zstd')
+    return compressions
+
+
+def _convert_block(block, convert):
+    if not isinstance(block, dict):
+        return block
+    converted = dict(block)
+    for key in HASH_FIELDS:
+        value = converted.get(key)
+        if value is not None:
+            converted[key] = convert(value)
+    return converted
+
+
+def _convert_blocks(message: Dict, convert) -> Dict:
+    # Hashes only ever sit at block level: message['block'] for new_block
+    # and each of message['chain'] for chain_update. Walking just those keeps
+    # this O(blocks) instead of visiting every transaction.
+    if not isinstance(message, dict):
+        return message
+    converted = message
+    if 'block' in message:
+        converted = dict(message, block=_convert_block(message['block'], convert))
+    if isinstance(message.get('chain'), list):
+        converted = dict(converted, chain=[_convert_block(block, convert) for block in message['chain']])
+    return converted
+
+
+def _pack_hash(value):
+    if isinstance(value, str) and len(value) == 64:
+        try:
+            return bytes.fromhex(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _unpack_hash(value):
+    return value.hex() if isinstance(value, bytes) else value
+
+
+def pack_hashes(message: Dict) -> Dict:
+    return _convert_blocks(message, _pack_hash)
+
+
+def unpack_hashes(message: Dict) -> Dict:
+    return _convert_blocks(message, _unpack_hash)
+
+
+class MinerCodec:
+    """Framing negotiated by a miner when it connects.
+
+    ``json`` with no compression is the default and keeps the original text
+    frames. Anything else is sent as binary frames: a one byte compression
+    header followed by the (optionally compressed) payload.
+    """
+
+    def __init__(self, encoding: str = 'json', compression: str = 'none'):
+        if encoding not in available_encodings():
+            raise ValueError(f"Unsupported encoding: {encoding}")
+        if compression not in available_compressions():
+            raise ValueError(f"Unsupported compression: {compression}")
+        self.encoding = encoding
+        self.compression = compression
+        self._compressor = zstandard.ZstdCompressor() if compression == 'zstd' else None
+        self._decompressor = zstandard.ZstdDecompressor() if zstandard is not None else None
+
+    def _inflate(self, header: int, payload: bytes) -> bytes:
+        if header == FRAME_DEFLATE:
+            decompressor = zlib.decompressobj()
+            payload = decompressor.decompress(payload, MAX_DECOMPRESSED_SIZE + 1)
+            oversized = bool(decompressor.unconsumed_tail)
+        else:
+            if self._decompressor is None:
+                raise ValueError("zstd frame received but zstandard is not installed")
+            # stream_reader ignores the content size the frame claims and
+            # only ever produces what we read.
+            with self._decompressor.stream_reader(payload) as reader:
+                payload = reader.read(MAX_DECOMPRESSED_SIZE + 1)
+            oversized = False
+        if oversized or len(payload) > MAX_DECOMPRESSED_SIZE:
+            raise ValueError(f"Frame decompresses to more than {MAX_DECOMPRESSED_SIZE} bytes")
+        return payload
+
+    @classmethod
+    def from_query(cls, query: Dict[str, str]) -> 'MinerCodec':
+        return cls(
+            encoding=query.get('encoding', 'json'),
+            compression=query.get('compression', 'none'),
+        )
+
+    @property
+    def key(self) -> tuple:
+        return (self.encoding, self.compression)
+
+    @property
+    def is_default(self) -> bool:
+        return self.key == ('json', 'none')
+
+    def encode(self, message: Dict):
+        if self.is_default:
+            return json.dumps(message, separators=(',', ':'))
+
+        if self.encoding == 'msgpack':
+            payload = msgpack.packb(pack_hashes(message), use_bin_type=True)
+        else:
+            payload = json.dumps(message, separators=(',', ':')).encode()
+
+        if len(payload) < COMPRESSION_THRESHOLD or self.compression == 'none':
+            return bytes([FRAME_RAW]) + payload
+        if self.compression == 'zstd':
+            return bytes([FRAME_ZSTD]) + self._compressor.compress(payload)
+        return bytes([FRAME_DEFLATE]) + zlib.compress(payload)
+
+    def decode(self, frame) -> Dict:
+        if isinstance(frame, str):
+            return json.loads(frame)
+
+        header, payload = frame[0], frame[1:]
+        if header in (FRAME_DEFLATE, FRAME_ZSTD):
+            payload = self._inflate(header, bytes(payload))
+        elif header != FRAME_RAW:
+            raise ValueError(f"Unknown frame header: {header}")
+
+        if self.encoding == 'msgpack':
+            return unpack_hashes(msgpack.unpackb(payload, raw=False))
+        return json.loads(payload)
+
+    async def send_encoded(self, websocket: WebSocket, frame) -> None:
+        if isinstance(frame, str):
+            await websocket.send_text(frame)
+        else:
+            await websocket.send_bytes(frame)
+
+    async def send(self, websocket: WebSocket, message: Dict) -> None:
+        await self.send_encoded(websocket, self.encode(message))
+
+    async def receive(self, websocket: WebSocket) -> Dict:
+        message = await websocket.receive()
+        if message['type'] == 'websocket.disconnect':
+            raise WebSocketDisconnect(message.get('code', 1000))
+        if message.get('bytes') is not None:
+            return self.decode(message['bytes'])
+        return self.decode(message.get('text') or '')
+
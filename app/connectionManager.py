@@ -1,23 +1,256 @@
-from fastapi import WebSocket
-from typing import List
+from fastapi import WebSocket, WebSocketDisconnect
+from typing import Dict, List, Optional
 import asyncio
+import functools
+import itertools
+import logging
+
+from app import metrics
+from app.codec import MinerCodec
+from app.outbox import Outbox
+
+logger = logging.getLogger(__name__)
 
 class ConnectionManager:
+
     def __init__(self):
         self.active_connections: List[WebSocket] = []
-        self.mining_lock = asyncio.Lock()   #TODO
+        self.codecs: Dict[WebSocket, MinerCodec] = {}
+        # Every frame goes through a per connection outbox, so sending never
+        # waits on a slow socket.
+        self.outboxes: Dict[WebSocket, Outbox] = {}
+
+        # Work distribution: miners that sent "subscribe" get block templates
+        # with their own nonce range and submit shares back.
+        self.workers: Dict[WebSocket, dict] = {}
+        self.nonce_range = 2 ** 32
+        self.share_difficulty = '000'
+        self.max_jobs_per_worker = 4
+        # Templates carry at most this many pending transactions (oldest
+        # first), which bounds both the build time and the prefix size.
+        self.max_template_transactions = 500
+        # Accepted shares remembered per job to reject duplicates; a job that
+        # fills up is exhausted and the miner should ask for a new one.
+        self.max_shares_per_job = 4096
+        # Mempool changes are coalesced for this long before new jobs go
+        # out. A new tip is pushed straight away.
+        self.job_push_delay = 0.5
+        self._job_ids = itertools.count(1)
+        self._nonce_slots = itertools.count(0)
+        # One template per snapshot shared by every worker, plus the encoded
+        # prefix per reward address.
+        self._template_version = None
+        self._template: Optional[dict] = None
+        self._prefixes: Dict[str, tuple] = {}
+        self._latest = None
+        self._tip_moved = False
+        self._wakeup = asyncio.Event()
+        self._tip_event = asyncio.Event()
+        self._pusher: Optional[asyncio.Task] = None
 
-    async def connect(self, websocket: WebSocket):
+    async def stop(self) -> None:
+        if self._pusher is not None:
+            self._pusher.cancel()
+            await asyncio.gather(self._pusher, return_exceptions=True)
+
+    async def connect(self, websocket: WebSocket, codec: MinerCodec = None):
         await websocket.accept()
         self.active_connections.append(websocket)
+        codec = self.codecs[websocket] = codec or MinerCodec()
+        name = f"miner {websocket.client.host}:{websocket.client.port}" if websocket.client else 'miner'
+        self.outboxes[websocket] = Outbox(
+            'miner', name, functools.partial(codec.send_encoded, websocket), websocket.close,
+            on_drop=functools.partial(self.disconnect, websocket)
+        )
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        if websocket in self.active_connections:
+            self.active_connections.remove(websocket)
+        self.codecs.pop(websocket, None)
+        self.workers.pop(websocket, None)
+        outbox = self.outboxes.pop(websocket, None)
+        if outbox is not None:
+            outbox.close()
+
+    def enqueue(self, websocket: WebSocket, frame) -> None:
+        outbox = self.outboxes.get(websocket)
+        if outbox is not None:
+            outbox.post(frame)
+
+    async def send(self, websocket: WebSocket, message: dict):
+        codec = self.codecs.get(websocket)
+        if codec is not None:
+            self.enqueue(websocket, codec.encode(message))
+
+    async def receive(self, websocket: WebSocket) -> dict:
+        codec = self.codecs.get(websocket)
+        if codec is None:
+            # Dropped by us (outbox full or a failed send); the endpoint
+            # must stop reading rather than answer into a closed outbox.
+            raise WebSocketDisconnect(1011)
+        return await codec.receive(websocket)
 
     async def broadcast(self, message: dict):
-        for connection in self.active_connections:
+        # Serialize once per negotiated framing rather than once per miner.
+        frames = {}
+        for connection in list(self.active_connections):
+            codec = self.codecs[connection]
+            if codec.key not in frames:
+                frames[codec.key] = codec.encode(message)
+            self.enqueue(connection, frames[codec.key])
+
+    async def subscribe(self, websocket: WebSocket, miner: str, blockchain, snapshot) -> None:
+        self.workers[websocket] = {
+            'miner': miner,
+            'jobs': {},
+            'shares': 0,
+            'blocks': 0,
+        }
+        await self.send_job(websocket, blockchain, snapshot)
+
+    def build_template(self, blockchain, snapshot) -> Optional[dict]:
+        """Template for ``snapshot`` without a reward address, built once."""
+        if self._template_version != snapshot.version:
+            transactions = list(snapshot.pending[:self.max_template_transactions])
+            template = blockchain.create_block_template(transactions, None, snapshot.tip) if transactions else None
+            self._template_version = snapshot.version
+            self._template = template
+            self._prefixes = {}
+        return self._template
+
+    def _miner_template(self, blockchain, miner: str) -> tuple:
+        # Only the reward differs between workers, so the encoded prefix is
+        # shared by every worker mining to the same address.
+        cached = self._prefixes.get(miner)
+        if cached is None:
+            template = dict(self._template, balances={miner: blockchain.mining_reward})
+            cached = self._prefixes[miner] = (template, blockchain.encode_block(template))
+        return cached
+
+    def make_job(self, websocket: WebSocket, blockchain, snapshot) -> Optional[dict]:
+        worker = self.workers[websocket]
+        if self.build_template(blockchain, snapshot) is None:
+            return None
+
+        template, prefix = self._miner_template(blockchain, worker['miner'])
+        nonce_start = next(self._nonce_slots) * self.nonce_range
+        job = {
+            'job_id': str(next(self._job_ids)),
+            'template': template,
+            'prefix': prefix,
+            'nonce_start': nonce_start,
+            'nonce_end': nonce_start + self.nonce_range,
+            'submitted': set(),
+        }
+
+        worker['jobs'][job['job_id']] = job
+        while len(worker['jobs']) > self.max_jobs_per_worker:
+            worker['jobs'].pop(next(iter(worker['jobs'])))
+        return job
+
+    async def send_job(self, websocket: WebSocket, blockchain, snapshot, clean_jobs: bool = False) -> None:
+        if clean_jobs:
+            self.workers[websocket]['jobs'].clear()
+        job = self.make_job(websocket, blockchain, snapshot)
+        if job is None:
+            await self.send(websocket, {
+                "type": "idle",
+                "message": "No pending transactions"
+            })
+            return
+
+        await self.send(websocket, {
+            "type": "job",
+            "job_id": job['job_id'],
+            "prefix": job['prefix'].decode(),
+            "nonce_start": job['nonce_start'],
+            "nonce_end": job['nonce_end'],
+            "target": blockchain.difficulty,
+            "share_target": self.share_difficulty,
+            "clean_jobs": clean_jobs
+        })
+
+    async def push_jobs(self, blockchain, snapshot, clean_jobs: bool = False) -> None:
+        if not self.workers:
+            return
+        # Deep copy and merkle root of up to max_template_transactions, off
+        # the event loop.
+        await asyncio.to_thread(self.build_template, blockchain, snapshot)
+        for websocket in list(self.workers):
             try:
-                await connection.send_json(message)
+                await self.send_job(websocket, blockchain, snapshot, clean_jobs=clean_jobs)
             except:
-                await self.disconnect(connection)
+                self.disconnect(websocket)
+
+    async def on_chain_update(self, blockchain, previous, snapshot) -> None:
+        # Chain actor listener: new templates whenever the tip or the mempool
+        # changes, dropping old jobs when the tip moved. Only records the
+        # change, the pusher task does the work.
+        if snapshot.tip is not previous.tip:
+            self._tip_moved = True
+            self._tip_event.set()
+        elif snapshot.pending == previous.pending:
+            return
+        self._latest = (blockchain, snapshot)
+        self._wakeup.set()
+        if self._pusher is None or self._pusher.done():
+            self._pusher = asyncio.create_task(self._push_forever())
+
+    async def _push_forever(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            if not self._tip_moved:
+                # Let a burst of transactions settle, unless the tip moves.
+                try:
+                    await asyncio.wait_for(self._tip_event.wait(), self.job_push_delay)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            self._tip_event.clear()
+            clean_jobs, self._tip_moved = self._tip_moved, False
+            blockchain, snapshot = self._latest
+            try:
+                await self.push_jobs(blockchain, snapshot, clean_jobs=clean_jobs)
+            except Exception:
+                logger.exception("Failed to push jobs")
+
+    def check_share(self, websocket: WebSocket, job_id: str, nonce: int, blockchain, snapshot) -> tuple:
+        """Verify a submitted nonce with a single hash.
+
+        Returns ``(status, block)`` where status is one of ``unknown_job``,
+        ``stale``, ``out_of_range``, ``duplicate``, ``low_difficulty``,
+        ``exhausted``, ``share`` or ``block``; block is only set for
+        ``block``.
+        """
+        worker = self.workers.get(websocket)
+        job = worker['jobs'].get(str(job_id)) if worker else None
+        if job is None:
+            return 'unknown_job', None
+
+        if job['template']['previous_hash'] != snapshot.tip['hash']:
+            return 'stale', None
+
+        if not job['nonce_start'] <= nonce < job['nonce_end']:
+            return 'out_of_range', None
+
+        if nonce in job['submitted']:
+            return 'duplicate', None
+
+        hash_operation = blockchain.hash_with_nonce(job['prefix'], nonce)
+        if not blockchain.meets_difficulty(hash_operation, self.share_difficulty):
+            return 'low_difficulty', None
+
+        # Only valid shares are remembered, and only so many per job.
+        if len(job['submitted']) >= self.max_shares_per_job:
+            return 'exhausted', None
+        job['submitted'].add(nonce)
+
+        worker['shares'] += 1
+        if not blockchain.meets_difficulty(hash_operation):
+            return 'share', None
 
+        worker['blocks'] += 1
+        block = dict(job['template'])
+        block['nonce'] = nonce
+        block['hash'] = hash_operation
+        return 'block', block
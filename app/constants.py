@@ -30,6 +30,19 @@ actions_box = """
 """
 
 
+# Precomputed genesis block, identical on every node. Blockchain checks its
+# proof of work on start instead of mining a new one.
+GENESIS_BLOCK = {
+    'index': 1,
+    'timestamp': '2024-11-01 00:00:00',
+    'transactions': [],
+    'balances': {},
+    'previous_hash': '0' * 64,
+    'merkle_root': 'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855',
+    'version': '1.0',
+    'nonce': 1089118,
+    'hash': '00000a453c9b3b90adfc68ae3203333c4ff23fd79e72041679a676ee0dd50e10',
+}
 
 
 def print_with_style():
@@ -0,0 +1,155 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Sender id used for coins created by a block's balances (mining rewards and
+# /add credits), which have no sending address.
+MINT = -1
+
+
+class TransferView:
+    """Read-only slice of the transfer columns as of one chain snapshot.
+
+    Every row is one movement of coins: ``sender`` pays ``amount`` to
+    ``receiver`` in the block at ``height`` (its index). Balance queries are
+    computed with ``np.bincount`` over the rows instead of scanning blocks.
+    """
+
+    def __init__(self, sender: np.ndarray, receiver: np.ndarray, amount: np.ndarray, height: np.ndarray,
+                 address_ids: Dict[str, int], addresses: List[str], tip_height: int):
+        self.sender = sender
+        self.receiver = receiver
+        self.amount = amount
+        self.height = height
+        self.tip_height = tip_height
+        # Shared with the writer, which only ever appends; ids at or above
+        # address_count belong to later snapshots.
+        self._address_ids = address_ids
+        self._addresses = addresses
+        self.address_count = len(addresses)
+        self._tip_balances: Optional[np.ndarray] = None
+
+    def _rows(self, height: Optional[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if height is None or height >= self.tip_height:
+            return self.sender, self.receiver, self.amount
+        # Rows are appended block by block, so heights are sorted.
+        end = int(np.searchsorted(self.height, height, side='right'))
+        return self.sender[:end], self.receiver[:end], self.amount[:end]
+
+    def balance_vector(self, height: Optional[int] = None) -> np.ndarray:
+        """Balance of every address id as of ``height`` (default: the tip)."""
+        at_tip = height is None or height >= self.tip_height
+        if at_tip and self._tip_balances is not None:
+            return self._tip_balances
+
+        sender, receiver, amount = self._rows(height)
+        credits = np.bincount(receiver, weights=amount, minlength=self.address_count)
+        spent = sender != MINT
+        debits = np.bincount(sender[spent], weights=amount[spent], minlength=self.address_count)
+        balances = credits[:self.address_count] - debits[:self.address_count]
+
+        if at_tip:
+            self._tip_balances = balances
+        return balances
+
+    def balances(self, addresses: List[str], height: Optional[int] = None) -> Dict[str, float]:
+        # Unknown addresses map to -1, which picks the trailing zero.
+        padded = np.append(self.balance_vector(height), 0.0)
+        ids = np.fromiter((self._address_ids.get(address, -1) for address in addresses),
+                          dtype=np.int64, count=len(addresses))
+        ids[ids >= self.address_count] = -1
+        return dict(zip(addresses, padded[ids].tolist()))
+
+    def state(self, height: Optional[int] = None) -> Dict[str, float]:
+        """Every address with a nonzero balance as of ``height``."""
+        vector = self.balance_vector(height)
+        held = np.flatnonzero(vector)
+        return {self._addresses[i]: float(vector[i]) for i in held.tolist()}
+
+    def richlist(self, n: int, height: Optional[int] = None) -> List[Tuple[str, float]]:
+        vector = self.balance_vector(height)
+        # Only addresses holding coins; ids that exist at the tip but had
+        # nothing at this height are not holders.
+        holders = np.flatnonzero(vector > 0)
+        n = min(n, len(holders))
+        if n <= 0:
+            return []
+        top = holders[np.argpartition(-vector[holders], n - 1)[:n]]
+        top = top[np.argsort(-vector[top], kind='stable')]
+        return [(self._addresses[i], float(vector[i])) for i in top.tolist()]
+
+    def supply(self, height: Optional[int] = None) -> float:
+        sender, _, amount = self._rows(height)
+        return float(amount[sender == MINT].sum())
+
+
+class TransferStore:
+    """Append-only columnar copy of every confirmed transfer.
+
+    Owned by the chain writer. Appending never touches rows a published
+    ``TransferView`` can see: rows are written past the current size and
+    growing the columns allocates new arrays.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.address_ids: Dict[str, int] = {}
+        self.addresses: List[str] = []
+        self.sender = np.empty(capacity, dtype=np.int32)
+        self.receiver = np.empty(capacity, dtype=np.int32)
+        self.amount = np.empty(capacity, dtype=np.float64)
+        self.height = np.empty(capacity, dtype=np.int64)
+        self.size = 0
+        self.tip_height = 0
+
+    def _address_id(self, address: str) -> int:
+        address_id = self.address_ids.get(address)
+        if address_id is None:
+            address_id = len(self.addresses)
+            self.addresses.append(address)
+            self.address_ids[address] = address_id
+        return address_id
+
+    def _reserve(self, rows: int) -> None:
+        needed = self.size + rows
+        if needed <= len(self.sender):
+            return
+        capacity = max(needed, len(self.sender) * 2)
+        for column in ('sender', 'receiver', 'amount', 'height'):
+            old = getattr(self, column)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, column, new)
+
+    def append_block(self, block: Dict) -> None:
+        rows = [(MINT, self._address_id(address), amount) for address, amount in block['balances'].items()]
+        rows.extend(
+            (self._address_id(tx['sender']), self._address_id(tx['receiver']), tx['amount'])
+            for tx in block['transactions']
+        )
+
+        self._reserve(len(rows))
+        if rows:
+            end = self.size + len(rows)
+            senders, receivers, amounts = zip(*rows)
+            self.sender[self.size:end] = senders
+            self.receiver[self.size:end] = receivers
+            self.amount[self.size:end] = amounts
+            self.height[self.size:end] = block['index']
+            self.size = end
+        self.tip_height = block['index']
+
+    def append_state(self, balances: Dict[str, float], height: int) -> None:
+        # Opening balances of a snapshot import, recorded as coins minted at
+        # the snapshot height since the transfers before it are not kept.
+        self.append_block({'index': height, 'balances': balances, 'transactions': []})
+
+    def view(self) -> TransferView:
+        return TransferView(
+            self.sender[:self.size],
+            self.receiver[:self.size],
+            self.amount[:self.size],
+            self.height[:self.size],
+            self.address_ids,
+            self.addresses,
+            self.tip_height,
+        )
@@ -1,22 +1,105 @@
+import datetime
+import hmac
 import json
+import logging
+import math
+import os
+import time
 from typing import Optional
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect,Response, status
+from fastapi import FastAPI, Header, Request, WebSocket, WebSocketDisconnect,Response, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
+import asyncio
 import random
-import datetime
 
-from app import constants
+from app import audit, bootstrap, constants, metrics, profiler, tracing
 from app.blockchain import Blockchain
+from app.chainActor import ChainActor
+from app.codec import MinerCodec, available_compressions, available_encodings
 from contextlib import asynccontextmanager
 from typing import Dict
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.connectionManager import ConnectionManager
-from app.schemas import BalanceRequest, TransactionRequest
+from app.mempool import MempoolFull
+from app.peers import PeerManager, WebSocketPeer
+from app.subscriptions import SubscriptionManager
+from app.schemas import BalanceRequest, BalancesRequest, TransactionRequest
+
+logging.basicConfig(
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def process_start_time() -> float:
+    # Wall clock time the process (the container's PID 1 under Kubernetes)
+    # was started, falling back to import time off Linux.
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/stat') as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith('btime'))
+        return boot_time + start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, StopIteration):
+        return time.time()
+
+
+PROCESS_STARTED = process_start_time()
+
+MAX_PAGE_SIZE = 1000
+
 
 class MyFastAPI(FastAPI):
     blockchain: Optional[Blockchain] = None
+    actor: Optional[ChainActor] = None
     manager: Optional[ConnectionManager] = None
+    peers: Optional[PeerManager] = None
+    subscriptions: Optional[SubscriptionManager] = None
+    janitor: Optional[asyncio.Task] = None
+    starter: Optional[asyncio.Task] = None
+    ready: bool = False
+    startup_seconds: Optional[float] = None
+    first_request_seconds: Optional[float] = None
+
+
+def mempool_oldest_age() -> float:
+    pending = app.actor.snapshot.pending
+    if not pending:
+        return 0
+    oldest = datetime.datetime.fromisoformat(pending[0]['timestamp'])
+    return (datetime.datetime.now() - oldest).total_seconds()
+
+
+async def expire_mempool() -> None:
+    # Transactions are also expired on admission; this catches a pool that
+    # stopped receiving new ones.
+    interval = min(app.blockchain.mempool.ttl / 4, 60)
+    while True:
+        await asyncio.sleep(interval)
+        expired = await app.actor.execute(app.blockchain.expire_pending)
+        if expired:
+            logger.info("Expired %s pending transactions", expired)
+
+
+async def start_node() -> None:
+    bootstrap_url = os.environ.get('BOOTSTRAP_URL')
+    if bootstrap_url:
+        try:
+            await bootstrap.bootstrap(
+                app.actor, app.blockchain, bootstrap_url,
+                int(os.environ.get('BOOTSTRAP_HEIGHT', '0')), os.environ.get('BOOTSTRAP_SNAPSHOT_HASH')
+            )
+        except Exception:
+            # Not fatal: peers can still sync us the slow way.
+            logger.exception("Bootstrap from %s failed", bootstrap_url)
+
+    await app.peers.start()
+    app.janitor = asyncio.create_task(expire_mempool())
+
+    app.startup_seconds = time.time() - PROCESS_STARTED
+    app.ready = True
+    logger.info("Ready %.3fs after process start", app.startup_seconds)
 
 
 @asynccontextmanager
@@ -25,14 +108,43 @@ async def lifespan(app:  MyFastAPI):
          constants.print_with_style()
 
          app.blockchain = Blockchain()
+         app.actor = ChainActor(app.blockchain)
          app.manager = ConnectionManager()
+         app.actor.listeners.append(
+             lambda previous, snapshot: app.manager.on_chain_update(app.blockchain, previous, snapshot)
+         )
+         app.subscriptions = SubscriptionManager()
+         app.actor.listeners.append(app.subscriptions.on_chain_update)
+         app.peers = PeerManager(app.actor, app.blockchain, os.environ.get('PEERS', '').split(','))
+         await app.actor.start()
 
-         print("Visit: http://127.0.0.1:3080 for API")
-         print("Visit: http://127.0.0.1:3080/docs for API documentation.")
-         print()  
+         metrics.CHAIN_HEIGHT.set_function(lambda: app.actor.snapshot.height)
+         metrics.MEMPOOL_SIZE.set_function(lambda: len(app.actor.snapshot.pending))
+         metrics.MEMPOOL_OLDEST_AGE.set_function(mempool_oldest_age)
+         metrics.WS_CONNECTIONS.set_function(lambda: len(app.manager.active_connections))
+         metrics.WS_WORKERS.set_function(lambda: len(app.manager.workers))
+         metrics.WS_SUBSCRIBERS.set_function(lambda: len(app.subscriptions.subscribers))
+
+         # Everything that may take long runs after startup, so the server
+         # is already answering /healthz (and /readyz with 503) meanwhile.
+         app.starter = asyncio.create_task(start_node())
+
+         logger.info("Visit: http://127.0.0.1:3080 for API")
+         logger.info("Visit: http://127.0.0.1:3080/docs for API documentation.")
          yield 
     finally:
-             print("\n🛑 Shutting down FastChain server...")
+             app.ready = False
+             if app.starter is not None:
+                 app.starter.cancel()
+             if app.janitor is not None:
+                 app.janitor.cancel()
+             if app.peers is not None:
+                 await app.peers.stop()
+             if app.manager is not None:
+                 await app.manager.stop()
+             if app.actor is not None:
+                 await app.actor.stop()
+             logger.info("🛑 Shutting down FastChain server...")
 
 
 app = MyFastAPI(
@@ -49,6 +161,101 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+@app.middleware("http")
+async def record_request(request: Request, call_next):
+    started = time.perf_counter()
+    trace = tracing.start_trace(f"{request.method} {request.url.path}")
+    try:
+        response = await call_next(request)
+    finally:
+        tracing.finish_trace(trace)
+    route = request.scope.get('route')
+    metrics.REQUEST_SECONDS.observe(
+        time.perf_counter() - started,
+        method=request.method,
+        path=route.path if route is not None else 'unmatched',
+        status=response.status_code
+    )
+    if app.first_request_seconds is None:
+        app.first_request_seconds = time.time() - PROCESS_STARTED
+        logger.info("First request served %.3fs after process start", app.first_request_seconds)
+    return response
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/debug/traces")
+async def get_traces(response: Response, limit: int = 50):
+    if limit <= 0:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {
+            'status': 'error',
+            'message': 'limit must be positive'
+        }
+    return {
+        'status': 'success',
+        'enabled': tracing.ENABLED,
+        'traces': tracing.recent_traces(limit)
+    }
+
+@app.post("/debug/tracing")
+async def set_tracing(enabled: bool, response: Response, x_debug_token: Optional[str] = Header(default=None)):
+    # Tracing costs every request, so switching it at runtime needs the
+    # operator's DEBUG_TOKEN; without one configured only TRACING=1 applies.
+    token = os.environ.get('DEBUG_TOKEN')
+    if not token or x_debug_token is None or not hmac.compare_digest(x_debug_token, token):
+        response.status_code = status.HTTP_403_FORBIDDEN
+        return {
+            'status': 'error',
+            'message': 'Toggling tracing needs a matching X-Debug-Token header'
+        }
+    tracing.set_enabled(enabled)
+    return {
+        'status': 'success',
+        'enabled': tracing.ENABLED
+    }
+
+@app.get("/debug/profile")
+async def get_profile(response: Response, seconds: float = 5, interval: float = 0.005):
+    if seconds <= 0 or interval < profiler.MIN_INTERVAL:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {
+            'status': 'error',
+            'message': f'seconds must be positive and interval at least {profiler.MIN_INTERVAL}'
+        }
+    try:
+        # Sampling runs on its own thread so the loop keeps serving (and is
+        # itself part of the profile).
+        collapsed = await asyncio.to_thread(profiler.sample, seconds, interval)
+    except profiler.ProfilerBusy as e:
+        response.status_code = status.HTTP_409_CONFLICT
+        return {
+            'status': 'error',
+            'message': str(e)
+        }
+    return PlainTextResponse(
+        collapsed,
+        headers={'Content-Disposition': 'attachment; filename="fastchain.collapsed"'}
+    )
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz(response: Response):
+    if not app.ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {
+            "status": "starting"
+        }
+    return {
+        "status": "ready",
+        "startup_seconds": app.startup_seconds,
+        "first_request_seconds": app.first_request_seconds
+    }
+
 @app.get("/")
 async def root():
 
@@ -82,9 +289,10 @@ async def root():
 @app.get("/dev")
 async def get_dev():
 
-    chain_length = len(app.blockchain.chain)
-    last_block = app.blockchain.get_previous_block()
-    pending_count = len(app.blockchain.get_pending_transactions())
+    snapshot = app.actor.snapshot
+    chain_length = snapshot.height
+    last_block = snapshot.tip
+    pending_count = len(snapshot.pending)
 
     return {
         "status": {
@@ -127,6 +335,10 @@ async def get_dev():
                 "validation": "Checks sender balance and transaction validity",
                 "requires_auth": False
             },
+            "GET /metrics": {
+                "description": "Prometheus metrics for the chain, mempool, miners and HTTP latency",
+                "requires_auth": False
+            },
             "GET /pending": {
                 "description": "Get list of pending transactions",
                 "returns": "Array of pending transactions with count",
@@ -143,7 +355,10 @@ async def get_dev():
                 "protocol": "WebSocket",
                 "events": {
                     "chain_update": "Receive full chain updates",
-                    "new_block": "Receive/broadcast new blocks"
+                    "new_block": "Receive/broadcast new blocks",
+                    "subscribe": "Register as a worker and receive block templates",
+                    "job": "Block template prefix with a dedicated nonce range",
+                    "submit": "Submit a nonce for a job as a share or a block"
                 },
                 "requires_auth": False
             }
@@ -156,127 +371,217 @@ async def get_dev():
 
 @app.websocket("/ws/miner")
 async def websocket_endpoint(websocket: WebSocket):
-    await app.manager.connect(websocket)
     try:
+        codec = MinerCodec.from_query(websocket.query_params)
+    except ValueError as e:
+        await websocket.accept()
         await websocket.send_json({
+            "status": "error",
+            "message": str(e),
+            "encodings": available_encodings(),
+            "compressions": available_compressions()
+        })
+        await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+        return
+
+    await app.manager.connect(websocket, codec)
+    try:
+        if not codec.is_default:
+            await websocket.send_json({
+                "type": "hello",
+                "encoding": codec.encoding,
+                "compression": codec.compression
+            })
+
+        await app.manager.send(websocket, {
             "type": "chain_update",
-            "chain": app.blockchain.chain
+            "chain": list(app.actor.snapshot.chain)
         })
         
         while True:
+            trace = None
             try:
-                data = await websocket.receive_json()
-                print("Ws message: ",data)
+                data = await app.manager.receive(websocket)
+                logger.debug("Ws message: %s", data)
+                trace = tracing.start_trace(f"WS {data.get('type')}")
                 
                 if data["type"] == "new_block":
-                    async with app.manager.mining_lock:
-                        print("Handling new block first removing pending and broadcasting")
-                        block = data["block"]
-                        if not block:
-                            await websocket.send_json({
-                                "status": "error",
-                                "message": "Invalid block data received"
-                            })
-                            continue
-                            
-                        if app.blockchain.is_valid_block(block):
-                            app.blockchain.chain.append(block)
-                            for tx in block['transactions']:
-                                app.blockchain.remove_pending_transaction(tx)
-                            await app.manager.broadcast({
-                                "type": "new_block",
-                                "block": block
-                            })
-                        else:
-                            await websocket.send_json({
-                                "status": "error",
-                                "message": "Invalid block structure"
-                            })
+                    logger.debug("Handling new block first removing pending and broadcasting")
+                    block = data["block"]
+                    if not block:
+                        await app.manager.send(websocket, {
+                            "status": "error",
+                            "message": "Invalid block data received"
+                        })
+                        continue
+                        
+                    if await app.actor.execute(app.blockchain.append_block, block):
+                        await app.manager.broadcast({
+                            "type": "new_block",
+                            "block": block
+                        })
+                    else:
+                        await app.manager.send(websocket, {
+                            "status": "error",
+                            "message": "Invalid block structure"
+                        })
                             
                 elif data["type"] == "chain_update":
                     new_chain = data["chain"]
                     if not new_chain:
-                        await websocket.send_json({
+                        await app.manager.send(websocket, {
                             "status": "error",
                             "message": "Invalid chain data received"
                         })
                         continue
                         
-                    if app.blockchain.resolve_conflicts(new_chain):
+                    if await app.actor.execute(app.blockchain.resolve_conflicts, new_chain):
                         await app.manager.broadcast({
                             "type": "chain_update",
-                            "chain": app.blockchain.chain
+                            "chain": list(app.actor.snapshot.chain)
                         })
                     else:
-                        await websocket.send_json({
+                        await app.manager.send(websocket, {
                             "status": "error",
                             "message": "Chain resolution failed"
                         })
 
                 elif data["type"] == "mine":
-                    async with app.manager.mining_lock:
-                        if not app.blockchain.is_chain_valid():
-                            await websocket.send_json({
-                                "status": "error",
-                                "message": "Blockchain Not Valid"
-                            })
-                            continue
-                         
-                        transactions = app.blockchain.get_pending_transactions()
-                        print(transactions)
-
-                        if not transactions:
-                            await websocket.send_json({
-                                "status": "error",
-                                "message": "No pending transactions"
-                            })
-                            continue
-                         
-                        print("Creating New Block")
-                        if "miner" not in data:
-                            await websocket.send_json({
-                                "status": "error",
-                                "message": "Miner address not provided"
-                            })
-                            continue
-
-                        block = app.blockchain.create_block_with_transactions(transactions, miner=data["miner"])
-            
-                        if not app.blockchain.is_valid_block(block):
-                            await websocket.send_json({
-                                "status": "error",
-                                "message": "Invalid block created"
-                            })
-                            continue
-            
-                        app.blockchain.chain.append(block)
-                        app.blockchain.clear_pending_transactions()
-            
-                        await app.manager.broadcast({
-                            "type": "new_block",
-                            "block": block
+                    snapshot = app.actor.snapshot
+                    if not app.blockchain.is_chain_valid(snapshot.chain):
+                        await app.manager.send(websocket, {
+                            "status": "error",
+                            "message": "Blockchain Not Valid"
+                        })
+                        continue
+                     
+                    transactions = list(snapshot.pending)
+                    logger.debug("%s", transactions)
+
+                    if not transactions:
+                        await app.manager.send(websocket, {
+                            "status": "error",
+                            "message": "No pending transactions"
+                        })
+                        continue
+                     
+                    logger.debug("Creating New Block")
+                    if "miner" not in data:
+                        await app.manager.send(websocket, {
+                            "status": "error",
+                            "message": "Miner address not provided"
+                        })
+                        continue
+
+                    block = await mine_block(snapshot, transactions, data["miner"])
+        
+                    if block is None:
+                        await app.manager.send(websocket, {
+                            "status": "error",
+                            "message": "Invalid block created"
                         })
+                        continue
+        
+                    await app.manager.broadcast({
+                        "type": "new_block",
+                        "block": block
+                    })
+
+                elif data["type"] == "subscribe":
+                    # Stratum-like mode: the miner does the proof of work on
+                    # templates we hand out and submits shares back.
+                    await app.manager.subscribe(websocket, data["miner"], app.blockchain, app.actor.snapshot)
+
+                elif data["type"] == "get_job":
+                    if websocket not in app.manager.workers:
+                        await app.manager.send(websocket, {
+                            "status": "error",
+                            "message": "Send subscribe before requesting work"
+                        })
+                        continue
+                    await app.manager.send_job(websocket, app.blockchain, app.actor.snapshot)
+
+                elif data["type"] == "submit":
+                    result, block = app.manager.check_share(
+                        websocket, data["job_id"], int(data["nonce"]), app.blockchain, app.actor.snapshot
+                    )
+                    metrics.SHARES.inc(result=result)
+
+                    if result in ("share", "block"):
+                        await app.manager.send(websocket, {
+                            "type": "share",
+                            "status": "accepted",
+                            "job_id": data["job_id"],
+                            "block": result == "block"
+                        })
+                    else:
+                        await app.manager.send(websocket, {
+                            "type": "share",
+                            "status": "rejected",
+                            "job_id": data["job_id"],
+                            "reason": result
+                        })
+
+                    if block is None:
+                        continue
+
+                    if not await app.actor.execute(app.blockchain.append_block, block):
+                        await app.manager.send(websocket, {
+                            "status": "error",
+                            "message": "Invalid block structure"
+                        })
+                        continue
+
+                    await app.manager.broadcast({
+                        "type": "new_block",
+                        "block": block
+                    })
                         
+            except WebSocketDisconnect:
+                raise
             except json.JSONDecodeError:
-                await websocket.send_json({
+                await app.manager.send(websocket, {
                     "status": "error",
                     "message": "Invalid JSON data received"
                 })
             except KeyError as e:
-                await websocket.send_json({
+                await app.manager.send(websocket, {
                     "status": "error",
                     "message": f"Missing required field: {str(e)}"
                 })
             except Exception as e:
-                await websocket.send_json({
+                await app.manager.send(websocket, {
                     "status": "error",
                     "message": f"Operation failed: {str(e)}"
                 })
+            finally:
+                tracing.finish_trace(trace)
                 
     except WebSocketDisconnect:
         app.manager.disconnect(websocket=websocket)
     finally:
-        print("Socket Closed")
+        logger.debug("Socket Closed")
+
+async def mine_block(snapshot, transactions, miner) -> Optional[Dict]:
+    # The proof of work runs off the event loop and off the writer, only the
+    # append is queued. Returns None if the tip moved or the block is invalid.
+    block = await asyncio.to_thread(
+        app.blockchain.create_block_with_transactions, transactions, miner, snapshot.tip
+    )
+    if not await app.actor.execute(app.blockchain.append_block, block):
+        return None
+    return block
+
+async def credit_block(receiver: str, amount: float, attempts: int = 3) -> Optional[Dict]:
+    # Like mine_block, for the credit block of /add. A block landing while
+    # we mine makes ours stale, so build on the new tip and try again.
+    for _ in range(attempts):
+        block = await asyncio.to_thread(
+            app.blockchain.create_credit_block, receiver, amount, app.actor.snapshot.tip
+        )
+        if await app.actor.execute(app.blockchain.append_block, block):
+            return block
+    return None
 
 @app.get("/mine")
 async def mine_api(miner: str, response: Response):
@@ -287,14 +592,15 @@ async def mine_api(miner: str, response: Response):
             "message": "Miner address not provided"
         }
 
-    if not app.blockchain.is_chain_valid():
+    snapshot = app.actor.snapshot
+    if not app.blockchain.is_chain_valid(snapshot.chain):
         response.status_code = status.HTTP_406_NOT_ACCEPTABLE
         return {
             "status": "error",
             "message": "Blockchain not valid"
         }
 
-    transactions = app.blockchain.get_pending_transactions()
+    transactions = list(snapshot.pending)
     if not transactions:
         response.status_code = status.HTTP_400_BAD_REQUEST
         return {
@@ -303,20 +609,17 @@ async def mine_api(miner: str, response: Response):
         }
 
     try:
-        print("Creating New Block")
-        block = app.blockchain.create_block_with_transactions(transactions, miner=miner)
+        logger.debug("Creating New Block")
+        block = await mine_block(snapshot, transactions, miner)
 
-        if not app.blockchain.is_valid_block(block):
+        if block is None:
             response.status_code = status.HTTP_400_BAD_REQUEST
             return {
                 "status": "error",
                 "message": "Invalid block created"
             }
 
-        app.blockchain.chain.append(block)
-        app.blockchain.clear_pending_transactions()
-
-        app.manager.broadcast({
+        await app.manager.broadcast({
             "type": "new_block",
             "block": block
         })
@@ -337,11 +640,12 @@ async def mine_api(miner: str, response: Response):
 @app.get('/blockchain')
 async def get_chain():
     try:
+        snapshot = app.actor.snapshot
         return {
             'status': 'success',
-            'chain': app.blockchain.chain,
-            'length': len(app.blockchain.chain),
-            'is_valid': app.blockchain.is_chain_valid()
+            'chain': list(snapshot.chain),
+            'length': snapshot.height,
+            'is_valid': app.blockchain.is_chain_valid(snapshot.chain)
         }
     except Exception as e:
         return {
@@ -349,13 +653,157 @@ async def get_chain():
             'message': f"Failed to retrieve chain: {str(e)}"
         }
 
+@app.get('/snapshot')
+async def get_snapshot(request: Request, response: Response, height: Optional[int] = None):
+    snapshot = app.actor.snapshot
+    lowest = max(app.blockchain.base_height, 1)
+    height = height if height is not None else snapshot.height
+    if not lowest <= height <= snapshot.height:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {
+            'status': 'error',
+            'message': f'Height must be between {lowest} and {snapshot.height}'
+        }
+
+    manifest, lines = await asyncio.to_thread(
+        bootstrap.build_snapshot, snapshot, height, app.blockchain.difficulty
+    )
+    etag = f'"{manifest["snapshot_hash"]}"'
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return StreamingResponse(iter(lines), media_type='application/x-ndjson', headers={'ETag': etag})
+
+@app.get('/blocks')
+async def get_blocks(response: Response, start: int = 0, limit: int = bootstrap.BLOCKS_PAGE_SIZE):
+    # Full blocks above height ``start``, for nodes catching up after a snapshot.
+    if start < app.blockchain.base_height or limit <= 0:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {
+            'status': 'error',
+            'message': f'start must be at least {app.blockchain.base_height} and limit positive'
+        }
+
+    blocks = app.actor.snapshot.chain[start:start + min(limit, bootstrap.BLOCKS_PAGE_SIZE)]
+    return {
+        'status': 'success',
+        'start': start,
+        'blocks': blocks
+    }
+
+@app.websocket("/ws/peer")
+async def peer_endpoint(websocket: WebSocket):
+    await websocket.accept()
+    try:
+        await app.peers.handle(WebSocketPeer(websocket))
+    except (WebSocketDisconnect, RuntimeError, ValueError):
+        pass
+    finally:
+        logger.debug("Peer socket closed")
+
+@app.websocket("/ws/subscribe")
+async def subscribe_endpoint(websocket: WebSocket):
+    await websocket.accept()
+    subscriber = app.subscriptions.connect(websocket)
+    try:
+        while not subscriber.outbox.closed:
+            message = await websocket.receive_json()
+            if not isinstance(message, dict):
+                await subscriber.outbox.put({"type": "error", "message": "Messages must be JSON objects"})
+                continue
+            kind = message.get("type")
+            if kind not in ("subscribe", "unsubscribe"):
+                await subscriber.outbox.put({"type": "error", "message": f"Unknown message type {kind!r}"})
+                continue
+
+            addresses = message.get("addresses", [])
+            txids = message.get("txids", [])
+            if not (isinstance(addresses, list) and isinstance(txids, list)
+                    and all(isinstance(key, str) for key in [*addresses, *txids])):
+                await subscriber.outbox.put({"type": "error", "message": "addresses and txids must be lists of strings"})
+                continue
+
+            try:
+                if kind == "subscribe":
+                    app.subscriptions.subscribe(subscriber, addresses, txids)
+                else:
+                    app.subscriptions.unsubscribe(subscriber, addresses, txids)
+            except ValueError as e:
+                await subscriber.outbox.put({"type": "error", "message": str(e)})
+                continue
+
+            await subscriber.outbox.put({
+                "type": "subscribed",
+                "addresses": len(subscriber.addresses),
+                "txids": len(subscriber.txids)
+            })
+    except (WebSocketDisconnect, RuntimeError, ValueError):
+        pass
+    finally:
+        app.subscriptions.disconnect(websocket)
+        logger.debug("Subscriber socket closed")
+
+@app.get('/audit')
+async def audit_api(response: Response, workers: Optional[int] = None,
+                    chunk_size: int = audit.DEFAULT_CHUNK_SIZE, progress: bool = False):
+    if chunk_size <= 0 or (workers is not None and not 0 < workers <= audit.MAX_WORKERS):
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {
+            'status': 'error',
+            'message': f'chunk_size must be positive and workers between 1 and {audit.MAX_WORKERS}'
+        }
+
+    # One audit at a time: each one may start a process pool.
+    try:
+        audit.acquire()
+    except audit.AuditBusy as e:
+        response.status_code = status.HTTP_409_CONFLICT
+        return {
+            'status': 'error',
+            'message': str(e)
+        }
+
+    chain = list(app.actor.snapshot.chain)
+    if not progress:
+        try:
+            report = await asyncio.to_thread(
+                audit.audit_chain, chain, app.blockchain.difficulty, workers, chunk_size
+            )
+        finally:
+            audit.release()
+        return {'status': 'success', **report}
+
+    # Stream newline delimited JSON: progress lines, then the report.
+    loop = asyncio.get_running_loop()
+    updates: asyncio.Queue = asyncio.Queue()
+
+    def report_progress(done: int, total: int) -> None:
+        loop.call_soon_threadsafe(updates.put_nowait, {'audited': done, 'total': total})
+
+    task = asyncio.create_task(asyncio.to_thread(
+        audit.audit_chain, chain, app.blockchain.difficulty, workers, chunk_size, report_progress
+    ))
+    # Released when the audit ends, even if the client never reads the stream.
+    task.add_done_callback(lambda _: audit.release())
+
+    async def stream():
+        while not task.done() or not updates.empty():
+            try:
+                update = await asyncio.wait_for(updates.get(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            yield json.dumps(update) + "\n"
+        yield json.dumps({'status': 'success', **task.result()}) + "\n"
+
+    return StreamingResponse(stream(), media_type='application/x-ndjson')
+
 @app.get('/peer')
 async def get_peer():
     try:
         return {
             'status': 'success',
-            'chain': app.blockchain.peer_b,
-            'length': len(app.blockchain.peer_b)
+            'node_id': app.peers.node_id,
+            'peers': app.peers.status(),
+            'count': len(app.peers.peers)
         }
     except Exception as e:
         return {
@@ -367,7 +815,7 @@ async def get_peer():
 async def add_transaction(transaction: TransactionRequest, response: Response):
     try:
         data = transaction.model_dump()
-        print("Adding txn", data)
+        logger.debug("Adding txn %s", data)
     
         if data['sender'] == data['receiver']:
             response.status_code = status.HTTP_400_BAD_REQUEST
@@ -382,8 +830,8 @@ async def add_transaction(transaction: TransactionRequest, response: Response):
                 'status': 'error',
                 'message': 'Amount must be positive'
             }
-    
-        sender_balance = app.blockchain.get_balance(data['sender'])
+
+        sender_balance = app.actor.snapshot.balances.get(data['sender'], 0)
         
         if sender_balance < data['amount']:
             response.status_code = status.HTTP_400_BAD_REQUEST
@@ -392,7 +840,18 @@ async def add_transaction(transaction: TransactionRequest, response: Response):
                 'message': 'Insufficient balance'
             }
     
-        app.blockchain.add_transaction(data["sender"], data["receiver"], data["amount"])
+        try:
+            await app.actor.execute(
+                app.blockchain.add_transaction, data["sender"], data["receiver"], data["amount"]
+            )
+        except MempoolFull as e:
+            response.status_code = status.HTTP_429_TOO_MANY_REQUESTS
+            response.headers['Retry-After'] = str(e.retry_after)
+            return {
+                'status': 'error',
+                'message': str(e),
+                'retry_after': e.retry_after
+            }
     
         return {
             'status': 'success',
@@ -401,7 +860,7 @@ async def add_transaction(transaction: TransactionRequest, response: Response):
         }
   
     except Exception as e:
-        print("Error", e)
+        logger.exception("Error adding transaction")
         response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
         return {
             'status': 'error',
@@ -409,13 +868,22 @@ async def add_transaction(transaction: TransactionRequest, response: Response):
         }
 
 @app.get('/pending')
-async def get_pending_transactions():
+async def get_pending_transactions(response: Response, offset: int = 0, limit: int = 100):
     try:
-        pending_txns = app.blockchain.get_pending_transactions()
+        if offset < 0 or not 0 < limit <= MAX_PAGE_SIZE:
+            response.status_code = status.HTTP_400_BAD_REQUEST
+            return {
+                'status': 'error',
+                'message': f'offset must not be negative and limit must be between 1 and {MAX_PAGE_SIZE}'
+            }
+
+        pending_txns = app.actor.snapshot.pending
         return {
             'status': 'success',
-            'pending_transactions': pending_txns,
-            'count': len(pending_txns)
+            'pending_transactions': pending_txns[offset:offset + limit],
+            'count': len(pending_txns),
+            'offset': offset,
+            'limit': limit
         }
     except Exception as e:
         return {
@@ -433,7 +901,7 @@ async def get_balance(address: str, response: Response):
                 'message': 'Address not provided'
             }
 
-        balance = app.blockchain.get_balance(address)
+        balance = app.actor.snapshot.balances.get(address, 0)
         if balance == 0:
             return {
                 'status': 'success',
@@ -454,6 +922,67 @@ async def get_balance(address: str, response: Response):
             'message': f'Failed to retrieve balance: {str(e)}'
         }
 
+@app.post('/balances')
+async def get_balances(request: BalancesRequest, response: Response):
+    try:
+        snapshot = app.actor.snapshot
+        lowest = max(app.blockchain.base_height, 1)
+        if request.height is not None and not lowest <= request.height <= snapshot.height:
+            response.status_code = status.HTTP_400_BAD_REQUEST
+            return {
+                'status': 'error',
+                'message': f'Height must be between {lowest} and {snapshot.height}'
+            }
+
+        height = request.height if request.height is not None else snapshot.height
+        return {
+            'status': 'success',
+            'height': height,
+            'balances': snapshot.transfers.balances(request.addresses, height)
+        }
+    except Exception as e:
+        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        return {
+            'status': 'error',
+            'message': f'Failed to retrieve balances: {str(e)}'
+        }
+
+@app.get('/richlist')
+async def get_richlist(response: Response, n: int = 10, height: Optional[int] = None):
+    try:
+        snapshot = app.actor.snapshot
+        if n <= 0:
+            response.status_code = status.HTTP_400_BAD_REQUEST
+            return {
+                'status': 'error',
+                'message': 'n must be positive'
+            }
+        # History below a snapshot import is not kept.
+        lowest = max(app.blockchain.base_height, 1)
+        if height is not None and not lowest <= height <= snapshot.height:
+            response.status_code = status.HTTP_400_BAD_REQUEST
+            return {
+                'status': 'error',
+                'message': f'Height must be between {lowest} and {snapshot.height}'
+            }
+
+        height = height if height is not None else snapshot.height
+        return {
+            'status': 'success',
+            'height': height,
+            'supply': snapshot.transfers.supply(height),
+            'holders': [
+                {'address': address, 'balance': balance}
+                for address, balance in snapshot.transfers.richlist(n, height)
+            ]
+        }
+    except Exception as e:
+        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        return {
+            'status': 'error',
+            'message': f'Failed to retrieve rich list: {str(e)}'
+        }
+
 @app.get('/hack')
 async def hack_block(passwd:str):
     try:
@@ -462,7 +991,7 @@ async def hack_block(passwd:str):
                 'status': 'error',
                 'message': 'Wrong   provided ?passwd="....'
             }
-        chain_length = len(app.blockchain.chain)
+        chain_length = app.actor.snapshot.height
         
         if(chain_length <= 1):
             return {
@@ -470,12 +999,8 @@ async def hack_block(passwd:str):
             }
             
             
-        block_id = random.randint(1, len(app.blockchain.chain)-1)
-        block = app.blockchain.chain[block_id]
-        
-        block['timestamp'] = str(datetime.datetime.now())
-        block['hash'] = app.blockchain.hash(block)
-        app.blockchain.chain[block_id] = block
+        block_id = random.randint(1, chain_length-1)
+        block = await app.actor.execute(app.blockchain.hack_block, block_id)
         
         return {
             'status': 'success',
@@ -506,13 +1031,32 @@ async def add_money(data: BalanceRequest, response: Response):
                 'status': 'error',
                 'message': 'Amount not provided'
             }
-        
-        res = app.blockchain.add_balance(req["receiver"], amount=req["amount"])
-        
+
+        if not math.isfinite(req["amount"]) or req["amount"] <= 0:
+            response.status_code = status.HTTP_400_BAD_REQUEST
+            return {
+                'status': 'error',
+                'message': 'Amount must be positive'
+            }
+
+        block = await credit_block(req["receiver"], req["amount"])
+        if block is None:
+            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+            return {
+                'status': 'error',
+                'message': 'The chain kept moving, try again'
+            }
+
+        await app.manager.broadcast({
+            "type": "new_block",
+            "block": block
+        })
+
         return {
             'status': 'success',
             'message': 'Balance added successfully',
-            'data': res
+            'data': block['balances'],
+            'block': block
         }
     except Exception as e:
         response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -0,0 +1,111 @@
+import math
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app import metrics
+
+# Bounded pool of pending transactions. Admission is O(1): pending
+# transactions are kept in admission order, so the oldest one comes first
+# for expiry and for the Retry-After hint, with a running total of each
+# sender's pending outgoing amount.
+
+DEFAULT_CAPACITY = int(os.environ.get('MEMPOOL_CAPACITY', '5000'))
+DEFAULT_TTL = float(os.environ.get('MEMPOOL_TTL', '3600'))
+DEFAULT_MAX_PER_SENDER = int(os.environ.get('MEMPOOL_MAX_PER_SENDER', '100'))
+
+# Upper bound for the Retry-After hint given to rejected submitters.
+MAX_RETRY_AFTER = 30
+
+
+class MempoolFull(Exception):
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Mempool:
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, ttl: float = DEFAULT_TTL,
+                 max_per_sender: int = DEFAULT_MAX_PER_SENDER):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.max_per_sender = max_per_sender
+        # tx_id -> (transaction, admitted at), in admission order
+        self._entries: Dict[str, Tuple[Dict, float]] = {}
+        self._sender_count: Dict[str, int] = {}
+        self._outgoing: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, tx_id: str) -> bool:
+        return tx_id in self._entries
+
+    def __iter__(self) -> Iterator[Dict]:
+        return (transaction for transaction, _ in self._entries.values())
+
+    def outgoing(self, sender: str) -> float:
+        return self._outgoing.get(sender, 0.0)
+
+    def add(self, tx_id: str, transaction: Dict, now: Optional[float] = None) -> None:
+        """Admit ``transaction``.
+
+        Raises MempoolFull when the sender already has ``max_per_sender``
+        pending transactions or the pool is at capacity. Nothing is evicted
+        to make room, so a flood is turned away instead of pushing out
+        transactions already pending; call ``expire`` first to free the
+        slots of expired ones.
+        """
+        now = time.monotonic() if now is None else now
+        sender = transaction['sender']
+
+        if self._sender_count.get(sender, 0) >= self.max_per_sender:
+            metrics.MEMPOOL_REJECTED.inc(reason='sender_limit')
+            raise MempoolFull(f"Sender has {self.max_per_sender} pending transactions", self.retry_after(now))
+
+        if len(self._entries) >= self.capacity:
+            metrics.MEMPOOL_REJECTED.inc(reason='full')
+            raise MempoolFull("Mempool is full", self.retry_after(now))
+
+        self._entries[tx_id] = (transaction, now)
+        self._sender_count[sender] = self._sender_count.get(sender, 0) + 1
+        self._outgoing[sender] = self._outgoing.get(sender, 0.0) + transaction['amount']
+
+    def remove(self, tx_id: str) -> Optional[Dict]:
+        entry = self._entries.pop(tx_id, None)
+        if entry is None:
+            return None
+        transaction = entry[0]
+        sender = transaction['sender']
+        self._sender_count[sender] -= 1
+        self._outgoing[sender] -= transaction['amount']
+        if not self._sender_count[sender]:
+            del self._sender_count[sender]
+            del self._outgoing[sender]
+        return transaction
+
+    def expire(self, now: Optional[float] = None) -> List[Dict]:
+        """Drop transactions older than the TTL and return them."""
+        now = time.monotonic() if now is None else now
+        expired = []
+        for tx_id, (_, admitted) in self._entries.items():
+            if now - admitted < self.ttl:
+                break
+            expired.append(tx_id)
+        if expired:
+            metrics.MEMPOOL_EVICTED.inc(len(expired), reason='ttl')
+        return [self.remove(tx_id) for tx_id in expired]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._sender_count.clear()
+        self._outgoing.clear()
+
+    def retry_after(self, now: float) -> int:
+        # Space is freed by the next block or, at the latest, when the
+        # oldest transaction expires.
+        oldest = next(iter(self._entries.values()), None)
+        if oldest is None:
+            return 1
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(oldest[1] + self.ttl - now)))
@@ -0,0 +1,178 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Minimal Prometheus text exposition (format 0.0.4) without pulling in a
+# client library. Metrics are safe to update from the chain writer thread.
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REGISTRY: List['Metric'] = []
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}' for key, value in values]
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function = function
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        # Evaluated at scrape time, for values that are cheap to read but
+        # not worth tracking on every change.
+        self._function = function
+
+    def samples(self) -> List[str]:
+        if self._function is not None:
+            try:
+                return [f'{self.name} {_format_value(self._function())}']
+            except Exception:
+                return []
+        with self._lock:
+            values = list(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}' for key, value in values]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(state)) for key, state in self._values.items()]
+        lines = []
+        for key, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}')
+            le = 'le="+Inf"'
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(state[-1])}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(state[-1])}')
+        return lines
+
+
+def render() -> str:
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+# Proof of work
+NONCE_ATTEMPTS = Counter('fastchain_nonce_attempts_total', 'Nonces hashed by the server while mining')
+POW_SECONDS = Histogram('fastchain_pow_seconds', 'Time spent searching for a nonce', buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+HASH_RATE = Gauge('fastchain_hash_rate', 'Hashes per second of the last server side proof of work')
+SHARES = Counter('fastchain_shares_total', 'Shares submitted by distributed miners', ('result',))
+
+# Validation
+BLOCK_VALIDATION_SECONDS = Histogram('fastchain_block_validation_seconds', 'Time spent validating', ('check',))
+MERKLE_SECONDS = Histogram('fastchain_merkle_seconds', 'Time spent computing merkle roots')
+
+# Chain and mempool
+CHAIN_HEIGHT = Gauge('fastchain_chain_height', 'Number of blocks in the chain')
+MEMPOOL_SIZE = Gauge('fastchain_mempool_size', 'Number of pending transactions')
+MEMPOOL_OLDEST_AGE = Gauge('fastchain_mempool_oldest_age_seconds', 'Age of the oldest pending transaction')
+MEMPOOL_REJECTED = Counter('fastchain_mempool_rejected_total', 'Transactions refused by mempool admission control', ('reason',))
+MEMPOOL_EVICTED = Counter('fastchain_mempool_evicted_total', 'Pending transactions dropped after their TTL', ('reason',))
+
+# Network
+WS_CONNECTIONS = Gauge('fastchain_ws_connections', 'Open miner WebSocket connections')
+WS_WORKERS = Gauge('fastchain_ws_workers', 'Miners subscribed to distributed work')
+WS_SUBSCRIBERS = Gauge('fastchain_ws_subscribers', 'Open address and transaction subscription WebSockets')
+BROADCAST_SECONDS = Histogram('fastchain_broadcast_seconds', 'Time from queueing a message for a connection to having sent it', ('connection',))
+
+# HTTP
+REQUEST_SECONDS = Histogram('fastchain_http_request_seconds', 'HTTP request latency', ('method', 'path', 'status'))
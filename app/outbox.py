@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# Messages queued for a connection that is not reading. Past this the
+# connection is dropped rather than holding memory for it or stalling the
+# chain writer's listeners.
+MAX_QUEUED = 256
+
+
+class Outbox:
+    """Bounded queue of outgoing messages for one connection.
+
+    A task per outbox does the sending, so nothing else ever waits on the
+    socket. ``post`` never waits and is what chain listeners and broadcasts
+    use: when the queue is full the connection is dropped, ``on_drop`` runs
+    and ``close`` is scheduled. ``put`` waits for room instead, for replies
+    that should only slow down the connection that asked for them. Used for
+    miners, peers and subscribers alike; ``kind`` labels the broadcast lag
+    metric, the time from queueing a message to having written it.
+    """
+
+    def __init__(self, kind: str, name: str, send: Callable[[object], Awaitable[None]],
+                 close: Callable[[], Awaitable[None]], on_drop: Optional[Callable[[], None]] = None,
+                 maxsize: int = MAX_QUEUED):
+        self.kind = kind
+        self.name = name
+        self._send = send
+        self._close = close
+        self._on_drop = on_drop
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.closed = False
+        self._task = asyncio.create_task(self._send_forever())
+
+    async def _send_forever(self) -> None:
+        try:
+            while True:
+                queued, message = await self._queue.get()
+                await self._send(message)
+                metrics.BROADCAST_SECONDS.observe(time.monotonic() - queued, connection=self.kind)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info("Failed to send to %s: %s", self.name, e)
+            self.drop()
+
+    def post(self, message) -> bool:
+        """Queue ``message`` without waiting; False if the connection is gone."""
+        if self.closed:
+            return False
+        try:
+            self._queue.put_nowait((time.monotonic(), message))
+        except asyncio.QueueFull:
+            logger.info("Dropping %s that stopped reading", self.name)
+            self.drop()
+            return False
+        return True
+
+    async def put(self, message) -> None:
+        if not self.closed:
+            await self._queue.put((time.monotonic(), message))
+
+    def drop(self) -> None:
+        """Give up on the connection: stop sending, notify the owner, close it."""
+        if self.closed:
+            return
+        self.close()
+        if self._on_drop is not None:
+            self._on_drop()
+        asyncio.create_task(self._close_quietly())
+
+    def close(self) -> None:
+        """Stop sending, for an owner that is done with the connection."""
+        if self.closed:
+            return
+        self.closed = True
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
+        # Wake up anyone waiting in put(); what they queue is discarded.
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    async def _close_quietly(self) -> None:
+        try:
+            await self._close()
+        except Exception:
+            # Already closed by the other side.
+            pass
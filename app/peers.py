@@ -0,0 +1,383 @@
+import asyncio
+import collections
+import json
+import logging
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+from fastapi import WebSocket
+
+from app.blockchain import Blockchain
+from app.chainActor import ChainActor, ChainSnapshot
+from app.mempool import MempoolFull
+from app.outbox import Outbox
+
+logger = logging.getLogger(__name__)
+
+# Node to node gossip. Peers announce new blocks and transactions by hash
+# ("inv") and only fetch bodies they have not seen ("getdata"), so traffic
+# grows with new data rather than chain length.
+#
+# A node that is behind, or on a different branch, syncs with a block
+# locator: hashes of its own chain from the tip back to genesis, dense near
+# the tip and exponentially sparser below. The peer answers with its blocks
+# after the highest locator hash it shares, so the reply starts at the fork
+# point. Once the branch is longer than our chain it is validated and
+# replaces ours.
+#
+# Messages (JSON):
+#   status    {node_id, height, tip}      sent once when a connection opens
+#   getblocks {locator: [hash]}           ask for blocks after the fork point
+#   blocks    {start_height, blocks, more} blocks above start_height; more is
+#                                         true while the peer has further ones
+#   inv       {items: [{kind, hash}]}     kind is "block" or "tx"
+#   getdata   {items: [{kind, hash}]}
+#   block     {block}
+#   tx        {tx}
+
+MAX_INV_ITEMS = 500
+MAX_BLOCKS_PER_MESSAGE = 50
+MAX_LOCATOR = 64
+
+# Deepest fork we follow. Blocks of a competing branch are buffered until
+# it outgrows our chain, so this bounds the buffer per peer.
+MAX_REORG_DEPTH = 1000
+
+
+class RecentFilter:
+    """Bounded set of recently seen inventory, oldest entries fall out first."""
+
+    def __init__(self, capacity: int = 50000):
+        self.capacity = capacity
+        self._items: collections.OrderedDict = collections.OrderedDict()
+
+    def __contains__(self, item) -> bool:
+        return item in self._items
+
+    def add(self, item) -> bool:
+        """Returns False if the item was already present."""
+        if item in self._items:
+            self._items.move_to_end(item)
+            return False
+        self._items[item] = None
+        if len(self._items) > self.capacity:
+            self._items.popitem(last=False)
+        return True
+
+    def discard(self, item) -> None:
+        self._items.pop(item, None)
+
+
+class WebSocketPeer:
+    """Inbound peer connected to our /ws/peer endpoint."""
+
+    direction = 'inbound'
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.name = f"{websocket.client.host}:{websocket.client.port}" if websocket.client else 'inbound'
+
+    async def send(self, message: Dict) -> None:
+        await self.websocket.send_json(message)
+
+    async def receive(self) -> Dict:
+        return await self.websocket.receive_json()
+
+    async def close(self) -> None:
+        await self.websocket.close()
+
+
+class ClientPeer:
+    """Outbound peer we connected to with the websockets client."""
+
+    direction = 'outbound'
+
+    def __init__(self, connection, url: str):
+        self.connection = connection
+        self.name = url
+
+    async def send(self, message: Dict) -> None:
+        await self.connection.send(json.dumps(message))
+
+    async def receive(self) -> Dict:
+        return json.loads(await self.connection.recv())
+
+    async def close(self) -> None:
+        await self.connection.close()
+
+
+class PeerManager:
+    """Gossips blocks and transactions with other nodes.
+
+    Anything with async ``send(message)`` and ``receive()`` can be handed to
+    ``handle``, so several nodes can also be wired together in one process.
+    """
+
+    def __init__(self, actor: ChainActor, blockchain: Blockchain, peer_urls: Iterable[str] = ()):
+        self.actor = actor
+        self.blockchain = blockchain
+        self.peer_urls = [url for url in peer_urls if url]
+        self.node_id = uuid.uuid4().hex
+        self.peers: Dict[object, dict] = {}
+        self.seen = RecentFilter()
+        self._block_heights: Dict[str, int] = {}
+        self._pending: Dict[str, Dict] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._index_chain(actor.snapshot.chain)
+        actor.listeners.append(self.on_chain_update)
+
+    async def start(self) -> None:
+        for url in self.peer_urls:
+            self._tasks.append(asyncio.create_task(self.connect_forever(url)))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def connect_forever(self, url: str) -> None:
+        import websockets
+
+        delay = 1
+        while True:
+            try:
+                async with websockets.connect(url) as connection:
+                    delay = 1
+                    await self.handle(ClientPeer(connection, url))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.info("Peer %s unavailable: %s", url, e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    def _index_chain(self, chain: Iterable[Dict]) -> None:
+        self._block_heights = {block['hash']: block['index'] for block in chain}
+        for block_hash in self._block_heights:
+            self.seen.add(('block', block_hash))
+
+    def status(self) -> List[Dict]:
+        return [
+            {
+                'name': peer.name,
+                'direction': peer.direction,
+                'node_id': state['node_id'],
+                'height': state['height'],
+            }
+            for peer, state in self.peers.items()
+        ]
+
+    async def handle(self, peer) -> None:
+        # handle() notices a dropped peer on its next message and returns.
+        outbox = Outbox('peer', f"peer {peer.name}", peer.send, peer.close,
+                        on_drop=lambda: self.peers.pop(peer, None))
+        self.peers[peer] = {'node_id': None, 'height': 0, 'outbox': outbox}
+        try:
+            snapshot = self.actor.snapshot
+            await self.send(peer, {
+                "type": "status",
+                "node_id": self.node_id,
+                "height": snapshot.height,
+                "tip": snapshot.tip['hash']
+            })
+            while True:
+                message = await peer.receive()
+                if peer not in self.peers:
+                    break
+                try:
+                    keep = await self.dispatch(peer, message)
+                except Exception as e:
+                    # A malformed message costs the peer that message only.
+                    logger.info("Ignoring bad message from %s: %r", peer.name, e)
+                    continue
+                if not keep:
+                    break
+        finally:
+            outbox.close()
+            self.peers.pop(peer, None)
+
+    async def send(self, peer, message: Dict) -> None:
+        # Replies to a peer's own requests wait for room in its queue, which
+        # slows down only that peer's reader.
+        state = self.peers.get(peer)
+        if state is not None:
+            await state['outbox'].put(message)
+
+    def post(self, peer, message: Dict) -> None:
+        # For chain listeners: never waits, drops a peer that fell behind.
+        state = self.peers.get(peer)
+        if state is not None:
+            state['outbox'].post(message)
+
+    async def dispatch(self, peer, message: Dict) -> bool:
+        kind = message.get("type")
+        snapshot = self.actor.snapshot
+
+        if kind == "status":
+            if message.get("node_id") == self.node_id:
+                logger.info("Dropping connection to ourselves via %s", peer.name)
+                return False
+            self.peers[peer].update(node_id=message.get("node_id"), height=message.get("height", 0))
+            if message.get("height", 0) > snapshot.height:
+                await self._catch_up(peer, snapshot)
+
+        elif kind == "getblocks":
+            start = self._locate(snapshot, message.get("locator", []))
+            blocks = snapshot.chain[start:start + MAX_BLOCKS_PER_MESSAGE] if start is not None else ()
+            # Pruned blocks (below a snapshot import) cannot be served.
+            if blocks and not any(block.get('pruned') for block in blocks):
+                await self.send(peer, {
+                    "type": "blocks",
+                    "start_height": start,
+                    "blocks": list(blocks),
+                    "more": start + len(blocks) < snapshot.height
+                })
+
+        elif kind == "blocks":
+            await self._receive_branch(peer, message)
+
+        elif kind == "inv":
+            wanted = []
+            for item in message.get("items", [])[:MAX_INV_ITEMS]:
+                key = (item.get("kind"), item.get("hash"))
+                if key[0] in ("block", "tx") and self.seen.add(key):
+                    wanted.append(item)
+            if wanted:
+                await self.send(peer, {"type": "getdata", "items": wanted})
+
+        elif kind == "getdata":
+            for item in message.get("items", [])[:MAX_INV_ITEMS]:
+                body = self._find(snapshot, item.get("kind"), item.get("hash"))
+                if body is not None:
+                    await self.send(peer, {"type": item["kind"], item["kind"]: body})
+
+        elif kind == "block":
+            block = message["block"]
+            self.seen.add(('block', block['hash']))
+            if block['hash'] in self._block_heights:
+                return True
+            if not await self.actor.execute(self.blockchain.append_block, block):
+                if block.get('previous_hash') not in self._block_heights:
+                    # An orphan: this peer is ahead of us or on another
+                    # branch. Forget the block so it can be fetched again and
+                    # sync from the fork point.
+                    self.seen.discard(('block', block['hash']))
+                    await self._catch_up(peer, self.actor.snapshot)
+            else:
+                self.peers[peer]['height'] = max(self.peers[peer]['height'], block['index'])
+
+        elif kind == "tx":
+            tx = message["tx"]
+            self.seen.add(('tx', Blockchain.transaction_id(tx)))
+            try:
+                await self.actor.execute(self.blockchain.admit_transaction, tx)
+            except MempoolFull as e:
+                logger.debug("Dropping tx from %s: %s", peer.name, e)
+
+        return True
+
+    async def _catch_up(self, peer, snapshot: ChainSnapshot) -> None:
+        # At most one request per peer for a given height of ours, so a peer
+        # serving blocks we reject cannot keep us asking forever.
+        if self.peers[peer].get('sync_height') == snapshot.height:
+            return
+        self.peers[peer]['sync_height'] = snapshot.height
+        self.peers[peer]['branch'] = None
+        await self.send(peer, {"type": "getblocks", "locator": self.locator(snapshot.chain)})
+
+    @staticmethod
+    def locator(chain) -> List[str]:
+        hashes, step, height = [], 1, len(chain)
+        while height > 1:
+            hashes.append(chain[height - 1]['hash'])
+            if len(hashes) >= 10:
+                step *= 2
+            height -= step
+        hashes.append(chain[0]['hash'])
+        return hashes
+
+    def _locate(self, snapshot: ChainSnapshot, locator: List[str]) -> Optional[int]:
+        # Height of the highest block we share with the locator's chain.
+        for block_hash in locator[:MAX_LOCATOR]:
+            height = self._block_heights.get(block_hash)
+            if height is not None and height <= snapshot.height and snapshot.chain[height - 1]['hash'] == block_hash:
+                return height
+        return None
+
+    async def _receive_branch(self, peer, message: Dict) -> None:
+        state = self.peers[peer]
+        start = message.get("start_height")
+        blocks = message.get("blocks", [])[:MAX_BLOCKS_PER_MESSAGE]
+        if not isinstance(start, int) or not blocks:
+            return
+
+        branch = state.get('branch')
+        if branch is None or branch['fork_height'] + len(branch['blocks']) != start:
+            branch = state['branch'] = {'fork_height': start, 'blocks': []}
+        branch['blocks'].extend(blocks)
+        for block in blocks:
+            if isinstance(block, dict):
+                self.seen.add(('block', block.get('hash')))
+        last_hash = branch['blocks'][-1].get('hash') if isinstance(branch['blocks'][-1], dict) else None
+
+        if branch['fork_height'] + len(branch['blocks']) > self.actor.snapshot.height:
+            if not await self.actor.execute(self.blockchain.reorganize, branch['fork_height'], branch['blocks']):
+                logger.info("Rejected branch from %s forking at height %s", peer.name, branch['fork_height'])
+                state['branch'] = None
+                return
+            state['height'] = max(state['height'], self.actor.snapshot.height)
+            state['branch'] = {'fork_height': self.actor.snapshot.height, 'blocks': []}
+        elif len(branch['blocks']) > MAX_REORG_DEPTH:
+            logger.info("Fork from %s deeper than %s blocks, not following", peer.name, MAX_REORG_DEPTH)
+            state['branch'] = None
+            return
+
+        if message.get("more") and last_hash:
+            await self.send(peer, {"type": "getblocks", "locator": [last_hash]})
+
+    def _find(self, snapshot: ChainSnapshot, kind: str, item_hash: str) -> Optional[Dict]:
+        if kind == "block":
+            height = self._block_heights.get(item_hash)
+            if height is not None and height <= snapshot.height and not snapshot.chain[height - 1].get('pruned'):
+                return snapshot.chain[height - 1]
+        elif kind == "tx":
+            return self._pending.get(item_hash)
+        return None
+
+    def announce(self, items: List[Dict]) -> None:
+        for peer in list(self.peers):
+            self.post(peer, {"type": "inv", "items": items})
+
+    async def on_chain_update(self, previous: ChainSnapshot, snapshot: ChainSnapshot) -> None:
+        # Chain actor listener: every block and transaction that becomes part
+        # of our state is announced exactly once, wherever it came from.
+        items = []
+        extended = snapshot.height >= previous.height and snapshot.chain[previous.height - 1] is previous.tip
+        if extended:
+            for block in snapshot.chain[previous.height:]:
+                self._block_heights[block['hash']] = block['index']
+                self.seen.add(('block', block['hash']))
+                items.append({"kind": "block", "hash": block['hash']})
+        else:
+            self._index_chain(snapshot.chain)
+            for peer in list(self.peers):
+                self.post(peer, {
+                    "type": "status",
+                    "node_id": self.node_id,
+                    "height": snapshot.height,
+                    "tip": snapshot.tip['hash']
+                })
+
+        if snapshot.pending != previous.pending:
+            known = set(map(id, previous.pending))
+            for tx in snapshot.pending:
+                if id(tx) not in known:
+                    tx_id = Blockchain.transaction_id(tx)
+                    self._pending[tx_id] = tx
+                    self.seen.add(('tx', tx_id))
+                    items.append({"kind": "tx", "hash": tx_id})
+            current = set(map(id, snapshot.pending))
+            self._pending = {tx_id: tx for tx_id, tx in self._pending.items() if id(tx) in current}
+
+        for start in range(0, len(items), MAX_INV_ITEMS):
+            self.announce(items[start:start + MAX_INV_ITEMS])
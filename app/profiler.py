@@ -0,0 +1,54 @@
+import collections
+import os
+import sys
+import threading
+import time
+
+# On demand sampling profiler. Nothing runs until a profile is requested;
+# while it runs, a thread snapshots every other thread's stack at a fixed
+# interval and the result is returned as collapsed stacks ("a;b;c count"),
+# which flamegraph.pl and speedscope read directly.
+
+MAX_SECONDS = 60
+# Shorter intervals would have the sampler hold the GIL nearly all the time.
+MIN_INTERVAL = 0.001
+
+_running = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ':')
+
+
+def sample(seconds: float, interval: float = 0.005) -> str:
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    try:
+        me = threading.get_ident()
+        names = {}
+        stacks = collections.Counter()
+        deadline = time.monotonic() + min(seconds, MAX_SECONDS)
+        interval = max(interval, MIN_INTERVAL)
+
+        while time.monotonic() < deadline:
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)).replace(';', ':'))
+                stacks[';'.join(reversed(stack))] += 1
+            time.sleep(interval)
+
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+    finally:
+        _running.release()
@@ -1,3 +1,5 @@
+from typing import List, Optional
+
 from pydantic import BaseModel
 
 class TransactionRequest(BaseModel):
@@ -7,4 +9,8 @@ class TransactionRequest(BaseModel):
 
 class BalanceRequest(BaseModel):
     receiver: str
-    amount: float
\ No newline at end of file
+    amount: float
+
+class BalancesRequest(BaseModel):
+    addresses: List[str]
+    height: Optional[int] = None
@@ -0,0 +1,159 @@
+import functools
+import logging
+from typing import Dict, List, Set
+
+from fastapi import WebSocket
+
+from app.blockchain import Blockchain
+from app.chainActor import ChainSnapshot
+from app.outbox import Outbox
+
+logger = logging.getLogger(__name__)
+
+# Address and transaction filtered push notifications for wallets.
+#
+# Client messages (JSON):
+#   subscribe   {addresses: [...], txids: [...]}
+#   unsubscribe {addresses: [...], txids: [...]}
+#
+# Server messages:
+#   subscribed {addresses, txids}           current subscription counts
+#   events     {height, events: [...]}      one message per chain update
+#   error      {message}
+#
+# Events:
+#   pending   {txid, tx}                    admitted to the mempool
+#   confirmed {txid, tx, block_index, block_hash}
+#   dropped   {txid, tx}                    left the mempool without a block
+#   credit    {address, amount, block_index, block_hash}   mining reward or /add
+#   reorg     {height, tip}                 the chain was replaced; earlier
+#                                           confirmations may be void
+
+MAX_SUBSCRIPTIONS = 1000
+
+
+class Subscriber:
+
+    def __init__(self, websocket: WebSocket, outbox: Outbox):
+        self.websocket = websocket
+        self.outbox = outbox
+        self.addresses: Set[str] = set()
+        self.txids: Set[str] = set()
+
+
+class SubscriptionManager:
+    """Index of subscribed addresses and txids, fed by the chain actor.
+
+    Each chain update is matched against the index once and every
+    subscriber only receives the events it registered for.
+    """
+
+    def __init__(self):
+        self.subscribers: Dict[WebSocket, Subscriber] = {}
+        self.by_address: Dict[str, Set[Subscriber]] = {}
+        self.by_txid: Dict[str, Set[Subscriber]] = {}
+
+    def connect(self, websocket: WebSocket) -> Subscriber:
+        name = f"subscriber {websocket.client.host}:{websocket.client.port}" if websocket.client else 'subscriber'
+        outbox = Outbox('subscriber', name, websocket.send_json, websocket.close,
+                        on_drop=functools.partial(self.disconnect, websocket))
+        subscriber = self.subscribers[websocket] = Subscriber(websocket, outbox)
+        return subscriber
+
+    def disconnect(self, websocket: WebSocket) -> None:
+        subscriber = self.subscribers.pop(websocket, None)
+        if subscriber is not None:
+            subscriber.outbox.close()
+            self.unsubscribe(subscriber, subscriber.addresses, subscriber.txids)
+
+    def subscribe(self, subscriber: Subscriber, addresses: List[str], txids: List[str]) -> None:
+        new_addresses = set(addresses) - subscriber.addresses
+        new_txids = set(txids) - subscriber.txids
+        total = len(subscriber.addresses) + len(subscriber.txids) + len(new_addresses) + len(new_txids)
+        if total > MAX_SUBSCRIPTIONS:
+            raise ValueError(f"At most {MAX_SUBSCRIPTIONS} addresses and txids per connection")
+
+        for address in new_addresses:
+            self.by_address.setdefault(address, set()).add(subscriber)
+        for txid in new_txids:
+            self.by_txid.setdefault(txid, set()).add(subscriber)
+        subscriber.addresses |= new_addresses
+        subscriber.txids |= new_txids
+
+    def unsubscribe(self, subscriber: Subscriber, addresses, txids) -> None:
+        for index, keys, owned in ((self.by_address, addresses, subscriber.addresses),
+                                   (self.by_txid, txids, subscriber.txids)):
+            for key in list(keys):
+                if key not in owned:
+                    continue
+                owned.discard(key)
+                watchers = index.get(key)
+                if watchers is not None:
+                    watchers.discard(subscriber)
+                    if not watchers:
+                        del index[key]
+
+    def _match_tx(self, tx: Dict, tx_id: str) -> Set[Subscriber]:
+        matched = set(self.by_txid.get(tx_id, ()))
+        matched.update(self.by_address.get(tx['sender'], ()))
+        matched.update(self.by_address.get(tx['receiver'], ()))
+        return matched
+
+    async def on_chain_update(self, previous: ChainSnapshot, snapshot: ChainSnapshot) -> None:
+        # Chain actor listener.
+        if not self.subscribers:
+            return
+        events: Dict[Subscriber, List[Dict]] = {}
+
+        def emit(subscribers, event: Dict) -> None:
+            for subscriber in subscribers:
+                events.setdefault(subscriber, []).append(event)
+
+        extended = snapshot.height >= previous.height and snapshot.chain[previous.height - 1] is previous.tip
+        confirmed = set()
+        if extended:
+            for block in snapshot.chain[previous.height:]:
+                for address, amount in block['balances'].items():
+                    emit(self.by_address.get(address, ()), {
+                        "type": "credit",
+                        "address": address,
+                        "amount": amount,
+                        "block_index": block['index'],
+                        "block_hash": block['hash']
+                    })
+                for tx in block['transactions']:
+                    tx_id = Blockchain.transaction_id(tx)
+                    confirmed.add(tx_id)
+                    emit(self._match_tx(tx, tx_id), {
+                        "type": "confirmed",
+                        "txid": tx_id,
+                        "tx": tx,
+                        "block_index": block['index'],
+                        "block_hash": block['hash']
+                    })
+        else:
+            emit(self.subscribers.values(), {
+                "type": "reorg",
+                "height": snapshot.height,
+                "tip": snapshot.tip['hash']
+            })
+
+        if snapshot.pending != previous.pending:
+            known = set(map(id, previous.pending))
+            current = set(map(id, snapshot.pending))
+            for tx in snapshot.pending:
+                if id(tx) not in known:
+                    tx_id = Blockchain.transaction_id(tx)
+                    emit(self._match_tx(tx, tx_id), {"type": "pending", "txid": tx_id, "tx": tx})
+            for tx in previous.pending:
+                if id(tx) not in current:
+                    tx_id = Blockchain.transaction_id(tx)
+                    if tx_id not in confirmed:
+                        emit(self._match_tx(tx, tx_id), {"type": "dropped", "txid": tx_id, "tx": tx})
+
+        for subscriber, subscriber_events in events.items():
+            subscriber.outbox.post({
+                "type": "events",
+                "height": snapshot.height,
+                "events": subscriber_events
+            })
@@ -0,0 +1,102 @@
+import collections
+import contextvars
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Per request tracing. Off by default: span() then returns a shared no-op
+# context manager, so instrumented code pays one global lookup per stage.
+
+ENABLED = os.environ.get('TRACING', '').lower() in ('1', 'true', 'yes')
+
+traces: collections.deque = collections.deque(maxlen=int(os.environ.get('TRACE_BUFFER_SIZE', '256')))
+
+# Spans kept per trace. A long chain replace or a miner socket that stays
+# open records a span per block or message, so past this they are only
+# counted in the trace's dropped_spans.
+MAX_SPANS = int(os.environ.get('TRACE_MAX_SPANS', '256'))
+
+_current: contextvars.ContextVar = contextvars.ContextVar('fastchain_trace', default=None)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ('trace', 'name', 'started')
+
+    def __init__(self, trace: Dict, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        finished = time.perf_counter()
+        spans = self.trace['spans']
+        if len(spans) >= MAX_SPANS:
+            self.trace['dropped_spans'] += 1
+            return False
+        # list.append is atomic, spans may land from the chain writer thread.
+        spans.append({
+            'name': self.name,
+            'start_ms': round((self.started - self.trace['_started']) * 1000, 3),
+            'duration_ms': round((finished - self.started) * 1000, 3),
+            'thread': threading.current_thread().name,
+            'error': exc_type.__name__ if exc_type is not None else None,
+        })
+        return False
+
+
+def set_enabled(enabled: bool) -> None:
+    global ENABLED
+    ENABLED = enabled
+
+
+def span(name: str):
+    if not ENABLED:
+        return NOOP_SPAN
+    trace = _current.get()
+    if trace is None:
+        return NOOP_SPAN
+    return _Span(trace, name)
+
+
+def start_trace(name: str) -> Optional[contextvars.Token]:
+    if not ENABLED:
+        return None
+    return _current.set({
+        'name': name,
+        'timestamp': time.time(),
+        '_started': time.perf_counter(),
+        'spans': [],
+        'dropped_spans': 0,
+    })
+
+
+def finish_trace(token: Optional[contextvars.Token]) -> None:
+    if token is None:
+        return
+    trace = _current.get()
+    _current.reset(token)
+    trace['duration_ms'] = round((time.perf_counter() - trace.pop('_started')) * 1000, 3)
+    traces.append(trace)
+
+
+def recent_traces(limit: int = 50) -> List[Dict]:
+    if limit <= 0:
+        return []
+    return list(traces)[-limit:]
@@ -0,0 +1,55 @@
+"""Time miner framing on a full chain_update.
+
+Run from the repository root: python -m benchmarks.codec_bench [blocks] [transactions]
+"""
+import hashlib
+import sys
+import timeit
+
+from app import codec
+from app.codec import MinerCodec
+
+
+def make_chain(blocks: int, transactions: int) -> list:
+    chain = []
+    previous_hash = '0' * 64
+    for index in range(1, blocks + 1):
+        block_hash = hashlib.sha256(str(index).encode()).hexdigest()
+        chain.append({
+            'index': index,
+            'timestamp': '2024-01-01 00:00:00',
+            'transactions': [
+                {'sender': f'sender-{n}', 'receiver': f'receiver-{n}', 'amount': 1.5}
+                for n in range(transactions)
+            ],
+            'balances': {'miner': 1.0},
+            'previous_hash': previous_hash,
+            'merkle_root': hashlib.sha256(block_hash.encode()).hexdigest(),
+            'nonce': index,
+            'hash': block_hash,
+        })
+        previous_hash = block_hash
+    return chain
+
+
+def bench(label: str, func, number: int = 5) -> None:
+    seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+    print(f"{label:<28} {seconds * 1000:8.2f} ms")
+
+
+def main(blocks: int = 2000, transactions: int = 10) -> None:
+    message = {'type': 'chain_update', 'chain': make_chain(blocks, transactions)}
+    print(f"chain_update with {blocks} blocks of {transactions} transactions")
+    bench('pack_hashes', lambda: codec.pack_hashes(message))
+    packed = codec.pack_hashes(message)
+    bench('unpack_hashes', lambda: codec.unpack_hashes(packed))
+    for encoding in codec.available_encodings():
+        for compression in codec.available_compressions():
+            miner_codec = MinerCodec(encoding, compression)
+            frame = miner_codec.encode(message)
+            bench(f"encode {encoding}/{compression}", lambda: miner_codec.encode(message))
+            bench(f"decode {encoding}/{compression}", lambda: miner_codec.decode(frame))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
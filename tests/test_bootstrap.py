@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app import bootstrap
+from app.blockchain import Blockchain
+from app.chainActor import ChainActor
+
+
+def source_chain():
+    # Four blocks after genesis: two credits, a transfer and another credit.
+    async def main():
+        blockchain = Blockchain()
+        blockchain.difficulty = '00'
+        actor = ChainActor(blockchain)
+        await actor.start()
+        try:
+            for receiver in ('alice', 'bob'):
+                await actor.execute(blockchain.append_block, blockchain.create_credit_block(receiver, 10))
+            await actor.execute(blockchain.add_transaction, 'alice', 'carol', 4)
+            block = blockchain.create_block_template(blockchain.pending_transactions, 'miner')
+            block['nonce'], block['hash'] = blockchain.hash(block)
+            await actor.execute(blockchain.append_block, block)
+            await actor.execute(blockchain.append_block, blockchain.create_credit_block('dave', 1))
+            return blockchain, actor.snapshot
+        finally:
+            await actor.stop()
+    return asyncio.run(main())
+
+
+def fresh_node() -> Blockchain:
+    blockchain = Blockchain()
+    blockchain.difficulty = '00'
+    return blockchain
+
+
+def served(snapshot, height):
+    manifest, lines = bootstrap.build_snapshot(snapshot, height, '00')
+    return manifest, bootstrap.parse_snapshot(line.decode() for line in lines)
+
+
+def test_snapshot_import_then_catch_up_matches_the_source():
+    source, snapshot = source_chain()
+    manifest, (parsed, headers, accounts) = served(snapshot, 4)
+    assert parsed == manifest and accounts == {'alice': 6, 'bob': 10, 'carol': 4, 'miner': 50}
+
+    node = fresh_node()
+    assert node.import_snapshot(parsed, headers, accounts, manifest['snapshot_hash'])
+    assert node.append_block(source.chain[4])
+    for address in ('alice', 'bob', 'carol', 'dave', 'miner'):
+        assert node.get_balance(address) == source.get_balance(address)
+    assert node.chain[-1]['hash'] == source.chain[-1]['hash']
+
+
+def test_snapshot_import_rejects_anything_but_the_trusted_hash():
+    _, snapshot = source_chain()
+    manifest, (parsed, headers, accounts) = served(snapshot, 4)
+
+    assert not fresh_node().import_snapshot(parsed, headers, accounts, None)
+    assert not fresh_node().import_snapshot(parsed, headers, accounts, 'f' * 64)
+    assert not fresh_node().import_snapshot(parsed, headers, dict(accounts, mallory=100), manifest['snapshot_hash'])
+    # A node that already has blocks keeps them.
+    node, _ = source_chain()
+    assert not node.import_snapshot(parsed, headers, accounts, manifest['snapshot_hash'])
+
+
+def test_truncated_snapshot_is_refused():
+    _, snapshot = source_chain()
+    _, lines = bootstrap.build_snapshot(snapshot, 4, '00')
+    with pytest.raises(bootstrap.BootstrapError):
+        bootstrap.parse_snapshot(line.decode() for line in lines[:-1])
+
+
+def test_readyz_answers_503_until_bootstrap_finishes(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    release = threading.Event()
+
+    async def slow_bootstrap(actor, blockchain, url, height, snapshot_hash):
+        while not release.is_set():
+            await asyncio.sleep(0.01)
+        return height
+
+    monkeypatch.setenv('BOOTSTRAP_URL', 'http://source.invalid')
+    monkeypatch.setattr(bootstrap, 'bootstrap', slow_bootstrap)
+    with TestClient(app) as client:
+        assert client.get('/healthz').status_code == 200
+        assert client.get('/readyz').status_code == 503
+
+        release.set()
+        deadline = time.monotonic() + 5
+        while client.get('/readyz').status_code != 200:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
@@ -0,0 +1,96 @@
+import asyncio
+
+from app.blockchain import Blockchain
+from app.chainActor import ChainActor
+
+
+def run_actor(scenario):
+    async def main():
+        actor = ChainActor(Blockchain())
+        await actor.start()
+        try:
+            return await scenario(actor, actor.blockchain)
+        finally:
+            await actor.stop()
+    return asyncio.run(main())
+
+
+def append(blockchain, balances, transactions=()):
+    # Ledger bookkeeping only looks at index, balances and transactions, so
+    # skip the proof of work.
+    tip = blockchain.chain[-1]
+    blockchain.chain.append({
+        'index': tip['index'] + 1,
+        'previous_hash': tip['hash'],
+        'hash': f"block{tip['index'] + 1}",
+        'balances': balances,
+        'transactions': list(transactions),
+    })
+
+
+def test_snapshots_do_not_change_after_later_writes():
+    async def scenario(actor, blockchain):
+        await actor.execute(append, blockchain, {'miner': 50})
+        first = actor.snapshot
+        await actor.execute(append, blockchain, {'miner': 50}, [{'sender': 'miner', 'receiver': 'alice', 'amount': 20}])
+        await actor.execute(append, blockchain, {'alice': 5})
+        second = actor.snapshot
+
+        assert first.height == 2 and len(list(first.chain)) == 2
+        assert first.tip['hash'] == 'block2' and first.chain[-1] is first.tip
+        assert first.balances.get('alice', 0) == 0
+
+        assert second.height == 4 and second.chain[1:2] == (first.tip,)
+        assert dict(second.balances) == {**first.balances, 'miner': 80, 'alice': 25}
+        # The snapshot shares the writer's list instead of copying it.
+        assert second.chain.blocks is blockchain.chain
+    run_actor(scenario)
+
+
+def test_extension_only_applies_new_blocks_to_the_ledger():
+    async def scenario(actor, blockchain):
+        await actor.execute(append, blockchain, {'miner': 50})
+        before = actor.snapshot
+        store = actor._transfers
+        await actor.execute(append, blockchain, {'alice': 7})
+        after = actor.snapshot
+
+        assert actor._transfers is store
+        assert after.balances['alice'] == 7
+        assert after.transfers.balances(['alice', 'miner']) == {'alice': 7, 'miner': 50}
+        assert before.transfers.balances(['alice']) == {'alice': 0}
+        assert after.transfers.supply() == before.transfers.supply() + 7
+
+        # Same ledger as a full rebuild.
+        rebuilt = ChainActor(blockchain).snapshot
+        assert dict(rebuilt.balances) == dict(after.balances)
+        assert rebuilt.transfers.state() == after.transfers.state()
+    run_actor(scenario)
+
+
+def test_hacked_block_does_not_show_in_older_snapshots():
+    async def scenario(actor, blockchain):
+        await actor.execute(append, blockchain, {'miner': 50})
+        await actor.execute(append, blockchain, {'miner': 50})
+        before = actor.snapshot
+        hacked = await actor.execute(blockchain.hack_block, 1)
+
+        assert before.chain[1] is not hacked
+        assert actor.snapshot.chain[1] is hacked
+        assert isinstance(hacked['hash'], str)
+        assert dict(actor.snapshot.balances) == dict(before.balances)
+    run_actor(scenario)
+
+
+def test_chain_view_slices_and_indexes():
+    async def scenario(actor, blockchain):
+        for _ in range(4):
+            await actor.execute(append, blockchain, {'miner': 50})
+        chain = actor.snapshot.chain
+        blocks = list(blockchain.chain)
+        assert chain[:] == tuple(blocks)
+        assert chain[2:4] == tuple(blocks[2:4])
+        assert chain[::2] == tuple(blocks[::2])
+        assert chain[-1] is blocks[-1] and chain[-5] is blocks[0]
+        assert list(reversed(chain)) == blocks[::-1]
+    run_actor(scenario)
@@ -0,0 +1,85 @@
+import zlib
+
+import pytest
+
+from app import codec
+from app.codec import MinerCodec
+
+HASH = 'ab' * 32
+
+MESSAGE = {
+    'type': 'new_block',
+    'block': {
+        'hash': HASH,
+        'previous_hash': '00000' + 'c' * 59,
+        'merkle_root': 'not a hash',
+        'transactions': [{'sender': 'alice', 'receiver': 'bob', 'amount': 1.5}] * 50,
+    },
+}
+
+
+@pytest.mark.parametrize('encoding', codec.available_encodings())
+@pytest.mark.parametrize('compression', codec.available_compressions())
+def test_round_trip(encoding, compression):
+    miner_codec = MinerCodec(encoding, compression)
+    frame = miner_codec.encode(MESSAGE)
+    if miner_codec.is_default:
+        assert isinstance(frame, str)
+    else:
+        assert isinstance(frame, bytes)
+    assert miner_codec.decode(frame) == MESSAGE
+
+
+@pytest.mark.parametrize('compression', codec.available_compressions())
+def test_small_messages_are_not_compressed(compression):
+    frame = MinerCodec('json', compression).encode({'type': 'ping'})
+    if compression != 'none':
+        assert frame[0] == codec.FRAME_RAW
+
+
+def test_pack_hashes_only_packs_hex_hash_fields():
+    packed = codec.pack_hashes(MESSAGE)
+    assert packed['block']['hash'] == bytes.fromhex(HASH)
+    assert isinstance(packed['block']['previous_hash'], bytes)
+    assert packed['block']['merkle_root'] == 'not a hash'
+    assert codec.unpack_hashes(packed) == MESSAGE
+    assert MESSAGE['block']['hash'] == HASH
+
+
+def test_pack_hashes_converts_each_block_of_a_chain():
+    block = dict(MESSAGE['block'], transactions=[{'hash': HASH}])
+    message = {'type': 'chain_update', 'chain': [block, block]}
+    packed = codec.pack_hashes(message)
+    assert [b['hash'] for b in packed['chain']] == [bytes.fromhex(HASH)] * 2
+    # Transactions are left alone rather than walked.
+    assert packed['chain'][0]['transactions'] == [{'hash': HASH}]
+    assert codec.unpack_hashes(packed) == message
+
+
+def test_pack_hashes_ignores_messages_without_blocks():
+    message = {'type': 'share', 'hash': HASH, 'block': None}
+    assert codec.pack_hashes(message) == message
+
+
+def test_unsupported_options():
+    with pytest.raises(ValueError):
+        MinerCodec('xml')
+    with pytest.raises(ValueError):
+        MinerCodec('json', 'lz4')
+    with pytest.raises(ValueError):
+        MinerCodec('json', 'deflate').decode(b'\x7f{}')
+
+
+def test_oversized_deflate_frame_is_rejected():
+    bomb = bytes([codec.FRAME_DEFLATE]) + zlib.compress(b' ' * (codec.MAX_DECOMPRESSED_SIZE + 1))
+    with pytest.raises(ValueError):
+        MinerCodec('json', 'deflate').decode(bomb)
+
+
+@pytest.mark.skipif('zstd' not in codec.available_compressions(), reason='zstandard is not installed')
+def test_oversized_zstd_frame_is_rejected():
+    import zstandard
+
+    payload = zstandard.ZstdCompressor().compress(b' ' * (codec.MAX_DECOMPRESSED_SIZE + 1))
+    with pytest.raises(ValueError):
+        MinerCodec('json', 'zstd').decode(bytes([codec.FRAME_ZSTD]) + payload)
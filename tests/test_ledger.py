@@ -0,0 +1,68 @@
+import pytest
+
+from app.ledger import TransferStore
+
+
+def block(index, balances=None, transactions=()):
+    return {
+        'index': index,
+        'balances': balances or {},
+        'transactions': [{'sender': s, 'receiver': r, 'amount': a} for s, r, a in transactions],
+    }
+
+
+@pytest.fixture
+def store():
+    store = TransferStore(capacity=2)
+    store.append_block(block(1, {'miner': 50}))
+    store.append_block(block(2, {'miner': 50}, [('miner', 'alice', 30)]))
+    store.append_block(block(3, {'bob': 50}, [('alice', 'carol', 30)]))
+    return store
+
+
+def test_balances_at_tip_and_history(store):
+    view = store.view()
+    assert view.balances(['miner', 'alice', 'carol', 'nobody']) == {
+        'miner': 70, 'alice': 0, 'carol': 30, 'nobody': 0
+    }
+    assert view.balances(['miner', 'alice', 'carol'], height=2) == {'miner': 70, 'alice': 30, 'carol': 0}
+    assert view.balances(['miner', 'alice'], height=1) == {'miner': 50, 'alice': 0}
+
+
+def test_addresses_added_later_are_unknown_to_older_views(store):
+    view = store.view()
+    store.append_block(block(4, {'dave': 50}))
+    assert view.balances(['dave']) == {'dave': 0}
+    assert store.view().balances(['dave']) == {'dave': 50}
+
+
+def test_supply(store):
+    view = store.view()
+    assert view.supply() == 150
+    assert view.supply(height=2) == 100
+    assert view.supply(height=0) == 0
+
+
+def test_state_only_has_nonzero_balances(store):
+    view = store.view()
+    assert view.state() == {'miner': 70, 'carol': 30, 'bob': 50}
+    assert view.state(height=2) == {'miner': 70, 'alice': 30}
+
+
+def test_richlist_ranks_holders_only(store):
+    view = store.view()
+    assert view.richlist(10) == [('miner', 70), ('bob', 50), ('carol', 30)]
+    assert view.richlist(1) == [('miner', 70)]
+    assert view.richlist(10, height=1) == [('miner', 50)]
+    assert view.richlist(0) == []
+
+
+def test_append_state_records_opening_balances():
+    store = TransferStore()
+    store.append_state({'alice': 10, 'bob': 5}, height=100)
+    store.append_block(block(101, {'miner': 50}, [('alice', 'bob', 4)]))
+    view = store.view()
+    assert view.tip_height == 101
+    assert view.state(height=100) == {'alice': 10, 'bob': 5}
+    assert view.balances(['alice', 'bob', 'miner']) == {'alice': 6, 'bob': 9, 'miner': 50}
+    assert view.supply() == 65
@@ -0,0 +1,119 @@
+from unittest import mock
+
+import pytest
+
+from app.blockchain import Blockchain
+from app.mempool import Mempool, MempoolFull
+
+
+def tx(sender, receiver='bob', amount=1.0, n=0):
+    return {'sender': sender, 'receiver': receiver, 'amount': amount, 'timestamp': str(n), 'signature': ''}
+
+
+def add(pool, transaction, now=0.0):
+    return pool.add(Blockchain.transaction_id(transaction), transaction, now)
+
+
+def test_full_pool_rejects_without_evicting():
+    pool = Mempool(capacity=2, ttl=100, max_per_sender=10)
+    first, second = tx('a', n=1), tx('b', n=2)
+    add(pool, first, now=0)
+    add(pool, second, now=0)
+    with pytest.raises(MempoolFull) as excinfo:
+        add(pool, tx('c', n=3), now=90)
+    # The oldest transaction expires in 10 seconds.
+    assert excinfo.value.retry_after == 10
+    assert list(pool) == [first, second]
+    assert pool.outgoing('c') == 0
+
+    pool.expire(now=100)
+    add(pool, tx('c', n=3), now=100)
+    assert len(pool) == 1
+
+
+def test_empty_pool_without_capacity_rejects():
+    pool = Mempool(capacity=0)
+    with pytest.raises(MempoolFull):
+        add(pool, tx('a'))
+
+
+def test_per_sender_limit():
+    pool = Mempool(capacity=10, ttl=100, max_per_sender=2)
+    add(pool, tx('a', n=1))
+    add(pool, tx('a', n=2))
+    with pytest.raises(MempoolFull) as excinfo:
+        add(pool, tx('a', n=3), now=40)
+    assert 1 <= excinfo.value.retry_after <= 30
+    add(pool, tx('b', n=4))
+    assert len(pool) == 3
+
+
+def test_outgoing_tracks_add_and_remove():
+    pool = Mempool()
+    one, two = tx('a', amount=2.5, n=1), tx('a', amount=4.0, n=2)
+    add(pool, one)
+    add(pool, two)
+    assert pool.outgoing('a') == 6.5
+
+    assert pool.remove(Blockchain.transaction_id(one)) == one
+    assert pool.outgoing('a') == 4.0
+    assert pool.remove(Blockchain.transaction_id(one)) is None
+
+    pool.remove(Blockchain.transaction_id(two))
+    assert pool.outgoing('a') == 0
+    add(pool, one)
+    assert pool.outgoing('a') == 2.5
+
+
+def test_expire_drops_only_old_transactions():
+    pool = Mempool(ttl=10)
+    old, new = tx('a', n=1), tx('b', n=2)
+    add(pool, old, now=0)
+    add(pool, new, now=5)
+    assert pool.expire(now=9) == []
+    assert pool.expire(now=10) == [old]
+    assert list(pool) == [new]
+    assert pool.outgoing('a') == 0
+
+
+def test_add_does_not_expire():
+    pool = Mempool(ttl=10)
+    old = tx('a', n=1)
+    add(pool, old, now=0)
+    add(pool, tx('b', n=2), now=50)
+    assert old in list(pool)
+
+
+def test_blockchain_forgets_expired_transactions_when_full():
+    blockchain = Blockchain()
+    blockchain.mempool = Mempool(capacity=2, ttl=10, max_per_sender=2)
+    with mock.patch.object(blockchain, 'get_balance', return_value=100), \
+            mock.patch('app.mempool.time.monotonic') as clock:
+        clock.return_value = 0
+        blockchain.add_transaction('a', 'b', 1)
+        blockchain.add_transaction('a', 'c', 1)
+        clock.return_value = 5
+        with pytest.raises(MempoolFull):
+            blockchain.add_transaction('a', 'd', 1)
+        clock.return_value = 11
+        blockchain.add_transaction('a', 'e', 1)
+
+    assert len(blockchain.mempool) == 1
+    assert [tx['receiver'] for tx in blockchain.pending_transactions] == ['e']
+
+
+def test_txn_answers_429_when_the_pool_is_full():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as client:
+        app.blockchain.difficulty = '000'
+        app.blockchain.mempool = Mempool(capacity=1, ttl=60)
+        assert client.post('/add', json={'receiver': 'alice', 'amount': 10}).status_code == 200
+
+        assert client.post('/txn', json={'sender': 'alice', 'receiver': 'bob', 'amount': 1}).status_code == 200
+        response = client.post('/txn', json={'sender': 'alice', 'receiver': 'carol', 'amount': 1})
+        assert response.status_code == 429
+        assert 1 <= int(response.headers['Retry-After']) <= 30
+        assert [tx['receiver'] for tx in app.actor.snapshot.pending] == ['bob']
@@ -0,0 +1,27 @@
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app import outbox
+from app.main import app
+
+
+def test_miner_dropped_for_a_full_outbox_leaves_the_endpoint():
+    with TestClient(app) as client:
+        with client.websocket_connect('/ws/miner') as ws:
+            assert ws.receive_json()['type'] == 'chain_update'
+            server_socket = app.manager.active_connections[0]
+
+            def flood():
+                for _ in range(outbox.MAX_QUEUED + 1):
+                    app.manager.enqueue(server_socket, '{}')
+
+            client.portal.call(flood)
+            ws.send_json({'type': 'get_job'})
+            # The event loop is still serving requests...
+            assert client.get('/healthz').status_code == 200
+            # ...and the miner was closed rather than answered.
+            with pytest.raises(WebSocketDisconnect):
+                while True:
+                    ws.receive_json()
+        assert server_socket not in app.manager.codecs
@@ -0,0 +1,97 @@
+import asyncio
+
+from app.outbox import Outbox
+
+
+class Connection:
+
+    def __init__(self, stalled=False, broken=False):
+        self.sent = []
+        self.closed = 0
+        self.dropped = 0
+        self.stalled = asyncio.Event()
+        if not stalled:
+            self.stalled.set()
+        self.broken = broken
+
+    async def send(self, message):
+        if self.broken:
+            raise ConnectionError('gone')
+        await self.stalled.wait()
+        self.sent.append(message)
+
+    async def close(self):
+        self.closed += 1
+
+    def on_drop(self):
+        self.dropped += 1
+
+    def outbox(self, maxsize=4):
+        return Outbox('test', 'test', self.send, self.close, on_drop=self.on_drop, maxsize=maxsize)
+
+
+def test_messages_are_sent_in_order():
+    async def main():
+        connection = Connection()
+        outbox = connection.outbox()
+        for n in range(10):
+            assert outbox.post(n)
+            await asyncio.sleep(0)
+        await outbox.put(10)
+        await asyncio.sleep(0.01)
+        outbox.close()
+        return connection
+
+    connection = asyncio.run(main())
+    assert connection.sent == list(range(11))
+    assert connection.dropped == connection.closed == 0
+
+
+def test_full_outbox_drops_the_connection_once():
+    async def main():
+        connection = Connection(stalled=True)
+        outbox = connection.outbox(maxsize=2)
+        await asyncio.sleep(0)
+        results = [outbox.post(n) for n in range(5)]
+        await asyncio.sleep(0.01)
+        return connection, outbox, results
+
+    connection, outbox, results = asyncio.run(main())
+    # The sender task has not run yet, so only two fit.
+    assert results == [True, True, False, False, False]
+    assert outbox.closed
+    assert connection.dropped == 1 and connection.closed == 1
+
+
+def test_failed_send_drops_the_connection():
+    async def main():
+        connection = Connection(broken=True)
+        outbox = connection.outbox()
+        outbox.post('hello')
+        await asyncio.sleep(0.01)
+        return connection, outbox
+
+    connection, outbox = asyncio.run(main())
+    assert outbox.closed and connection.dropped == 1 and connection.closed == 1
+    assert not outbox.post('again')
+
+
+def test_close_releases_waiting_put():
+    async def main():
+        connection = Connection(stalled=True)
+        outbox = connection.outbox(maxsize=1)
+        await asyncio.sleep(0)
+        outbox.post(1)
+        await asyncio.sleep(0)
+        # 1 is stuck in send(), 2 fills the queue.
+        assert outbox.post(2)
+        waiting = asyncio.create_task(outbox.put(3))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        outbox.close()
+        await asyncio.wait_for(waiting, 1)
+        return connection
+
+    connection = asyncio.run(main())
+    # close() is for owners that already are done: no drop, no close.
+    assert connection.dropped == connection.closed == 0
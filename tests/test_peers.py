@@ -0,0 +1,195 @@
+import asyncio
+import json
+import math
+
+from app.blockchain import Blockchain
+from app.chainActor import ChainActor
+from app.peers import PeerManager
+
+
+class PipePeer:
+    """One end of an in-process connection between two nodes."""
+
+    direction = 'inbound'
+
+    def __init__(self, name: str):
+        self.name = name
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.other = None
+
+    async def send(self, message):
+        # Through JSON, like the real transport.
+        await self.other.inbox.put(json.loads(json.dumps(message)))
+
+    async def receive(self):
+        message = await self.inbox.get()
+        if message is None:
+            raise ConnectionError('closed')
+        return message
+
+    async def close(self):
+        await self.inbox.put(None)
+        await self.other.inbox.put(None)
+
+
+def pipe(a: str, b: str):
+    left, right = PipePeer(a), PipePeer(b)
+    left.other, right.other = right, left
+    return left, right
+
+
+class Node:
+
+    def __init__(self, name: str):
+        self.name = name
+        self.blockchain = Blockchain()
+        # Keeps the proof of work of a test block to a few thousand hashes.
+        self.blockchain.difficulty = '000'
+        self.actor = ChainActor(self.blockchain)
+        self.peers = PeerManager(self.actor, self.blockchain)
+
+    async def start(self):
+        await self.actor.start()
+
+    async def stop(self):
+        await self.actor.stop()
+
+    async def credit(self, receiver: str, amount: float):
+        # What POST /add does.
+        block = await asyncio.to_thread(
+            self.blockchain.create_credit_block, receiver, amount, self.actor.snapshot.tip
+        )
+        assert await self.actor.execute(self.blockchain.append_block, block)
+
+    async def mine(self, miner: str = 'miner'):
+        snapshot = self.actor.snapshot
+        block = await asyncio.to_thread(
+            self.blockchain.create_block_with_transactions, list(snapshot.pending), miner, snapshot.tip
+        )
+        assert await self.actor.execute(self.blockchain.append_block, block)
+
+    @property
+    def tip(self):
+        return self.actor.snapshot.tip['hash']
+
+
+def connect(a: Node, b: Node):
+    a_end, b_end = pipe(b.name, a.name)
+    return [asyncio.create_task(a.peers.handle(a_end)), asyncio.create_task(b.peers.handle(b_end))]
+
+
+def run_nodes(count, scenario):
+    async def main():
+        nodes = [Node(f"node{n}") for n in range(count)]
+        for node in nodes:
+            await node.start()
+        tasks = []
+        try:
+            await scenario(nodes, tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for node in nodes:
+                await node.stop()
+    asyncio.run(main())
+
+
+async def settle(condition, timeout=10.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, 'nodes did not converge'
+        await asyncio.sleep(0.01)
+
+
+def test_malformed_transactions_are_not_admitted():
+    blockchain = Blockchain()
+    for amount in (math.nan, math.inf, '5', True, None):
+        assert blockchain.admit_transaction({'sender': 'x', 'receiver': 'y', 'amount': amount}) == -1
+    assert blockchain.admit_transaction(['not', 'a', 'tx']) == -1
+    assert len(blockchain.mempool) == 0
+    assert blockchain.mempool.outgoing('x') == 0
+    assert blockchain.admit_transaction({'sender': 'x', 'receiver': 'y', 'amount': 1e9}) == -1
+
+
+def test_bad_peer_messages_do_not_end_the_connection():
+    async def main():
+        node = Node('a')
+        await node.start()
+        ours, theirs = pipe('a', 'remote')
+        handler = asyncio.create_task(node.peers.handle(ours))
+        try:
+            assert (await theirs.receive())['type'] == 'status'
+            for message in (
+                {'type': 'tx', 'tx': {'sender': 'x', 'receiver': 'y', 'amount': math.nan}},
+                {'type': 'tx', 'tx': {'sender': 'x', 'receiver': 'y', 'amount': '5'}},
+                {'type': 'tx'},
+                {'type': 'block', 'block': 'nonsense'},
+                ['not', 'an', 'object'],
+            ):
+                await theirs.send(message)
+            await theirs.send({'type': 'inv', 'items': [{'kind': 'tx', 'hash': 'ab' * 32}]})
+            reply = await asyncio.wait_for(theirs.receive(), 5)
+            assert reply == {'type': 'getdata', 'items': [{'kind': 'tx', 'hash': 'ab' * 32}]}
+            assert not handler.done()
+            assert len(node.blockchain.mempool) == 0
+        finally:
+            handler.cancel()
+            await node.stop()
+    asyncio.run(main())
+
+
+def test_credit_transaction_and_block_reach_the_other_node():
+    async def scenario(nodes, tasks):
+        a, b = nodes
+        tasks += connect(a, b)
+        await a.credit('alice', 100)
+        assert await a.actor.execute(a.blockchain.add_transaction, 'alice', 'bob', 10) == 3
+        await settle(lambda: len(b.actor.snapshot.pending) == 1)
+        await a.mine()
+
+        await settle(lambda: b.tip == a.tip)
+        assert b.actor.snapshot.height == 3
+        assert b.actor.snapshot.pending == ()
+        assert dict(b.actor.snapshot.balances) == dict(a.actor.snapshot.balances) == {
+            'alice': 90, 'bob': 10, 'miner': 50
+        }
+    run_nodes(2, scenario)
+
+
+def test_nodes_on_competing_branches_converge_on_the_longest():
+    async def scenario(nodes, tasks):
+        a, b = nodes
+        await a.credit('alice', 100)
+        await a.credit('alice', 1)
+        await a.credit('alice', 1)
+        await b.credit('carol', 100)
+        await b.actor.execute(b.blockchain.add_transaction, 'carol', 'dave', 5)
+        await b.mine()
+        assert a.actor.snapshot.height == 4 and b.actor.snapshot.height == 3
+
+        tasks += connect(a, b)
+        await settle(lambda: b.tip == a.tip)
+        assert dict(b.actor.snapshot.balances) == {'alice': 102}
+        # carol's coins only existed on the dropped branch.
+        assert b.actor.snapshot.pending == ()
+
+        # And they keep following each other afterwards.
+        await b.credit('erin', 5)
+        await settle(lambda: a.tip == b.tip)
+        assert a.actor.snapshot.height == 5
+    run_nodes(2, scenario)
+
+
+def test_blocks_are_relayed_along_a_line_of_nodes():
+    async def scenario(nodes, tasks):
+        a, b, c = nodes
+        tasks += connect(a, b)
+        tasks += connect(b, c)
+        await a.credit('alice', 10)
+        await settle(lambda: c.tip == a.tip)
+        await c.credit('carol', 10)
+        await settle(lambda: a.tip == b.tip == c.tip)
+        assert a.actor.snapshot.height == 3
+        assert dict(c.actor.snapshot.balances) == {'alice': 10, 'carol': 10}
+    run_nodes(3, scenario)
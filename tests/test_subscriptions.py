@@ -0,0 +1,40 @@
+from fastapi.testclient import TestClient
+
+from app.blockchain import Blockchain
+
+
+def test_subscriber_only_gets_events_for_its_addresses():
+    from app.main import app
+
+    with TestClient(app) as client, client.websocket_connect('/ws/subscribe') as socket:
+        app.blockchain.difficulty = '000'
+
+        socket.send_json(['alice'])
+        assert socket.receive_json() == {'type': 'error', 'message': 'Messages must be JSON objects'}
+        socket.send_json({'type': 'watch'})
+        assert socket.receive_json()['type'] == 'error'
+        socket.send_json({'type': 'subscribe', 'addresses': 'alice'})
+        assert socket.receive_json() == {'type': 'error', 'message': 'addresses and txids must be lists of strings'}
+
+        socket.send_json({'type': 'subscribe', 'addresses': ['alice']})
+        assert socket.receive_json() == {'type': 'subscribed', 'addresses': 1, 'txids': 0}
+
+        # Carol's credit is not ours, so the first event is Alice's.
+        assert client.post('/add', json={'receiver': 'carol', 'amount': 5}).status_code == 200
+        assert client.post('/add', json={'receiver': 'alice', 'amount': 10}).status_code == 200
+        message = socket.receive_json()
+        credit, = message['events']
+        block = app.actor.snapshot.tip
+        assert credit == {'type': 'credit', 'address': 'alice', 'amount': 10,
+                          'block_index': block['index'], 'block_hash': block['hash']}
+        assert message['height'] == block['index']
+
+        assert client.post('/txn', json={'sender': 'alice', 'receiver': 'bob', 'amount': 1}).status_code == 200
+        pending, = socket.receive_json()['events']
+        txid = Blockchain.transaction_id(pending['tx'])
+        assert (pending['type'], pending['txid'], pending['tx']['receiver']) == ('pending', txid, 'bob')
+
+        assert client.get('/mine', params={'miner': 'miner'}).status_code == 200
+        confirmed, = socket.receive_json()['events']
+        assert (confirmed['type'], confirmed['txid']) == ('confirmed', txid)
+        assert confirmed['block_hash'] == app.actor.snapshot.tip['hash']
@@ -0,0 +1,41 @@
+from fastapi.testclient import TestClient
+
+from app import tracing
+
+
+def test_spans_past_the_cap_are_counted_not_kept(monkeypatch):
+    monkeypatch.setattr(tracing, 'ENABLED', True)
+    monkeypatch.setattr(tracing, 'MAX_SPANS', 3)
+    monkeypatch.setattr(tracing, 'traces', tracing.collections.deque(maxlen=4))
+
+    token = tracing.start_trace('replace chain')
+    for n in range(5):
+        with tracing.span(f"block {n}"):
+            pass
+    tracing.finish_trace(token)
+
+    trace, = tracing.recent_traces()
+    assert [span['name'] for span in trace['spans']] == ['block 0', 'block 1', 'block 2']
+    assert trace['dropped_spans'] == 2
+
+
+def test_toggling_tracing_needs_the_debug_token(monkeypatch):
+    from app.main import app
+
+    monkeypatch.setattr(tracing, 'ENABLED', False)
+    client = TestClient(app)
+
+    monkeypatch.delenv('DEBUG_TOKEN', raising=False)
+    response = client.post('/debug/tracing', params={'enabled': 'true'}, headers={'X-Debug-Token': ''})
+    assert response.status_code == 403
+    assert not tracing.ENABLED
+
+    monkeypatch.setenv('DEBUG_TOKEN', 'secret')
+    response = client.post('/debug/tracing', params={'enabled': 'true'}, headers={'X-Debug-Token': 'guess'})
+    assert response.status_code == 403
+    assert not tracing.ENABLED
+
+    response = client.post('/debug/tracing', params={'enabled': 'true'}, headers={'X-Debug-Token': 'secret'})
+    assert response.status_code == 200
+    assert response.json() == {'status': 'success', 'enabled': True}
+    assert tracing.ENABLED
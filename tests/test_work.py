@@ -0,0 +1,100 @@
+import asyncio
+
+from app.blockchain import Blockchain
+from app.chainActor import ChainActor
+from app.connectionManager import ConnectionManager
+
+
+def run_pool(scenario, transactions=3):
+    # A funded sender with pending transactions, and a pool whose block
+    # target is easy enough to hit within a few hundred nonces.
+    async def main():
+        blockchain = Blockchain()
+        blockchain.difficulty = '00'
+        actor = ChainActor(blockchain)
+        await actor.start()
+        try:
+            await actor.execute(blockchain.append_block, blockchain.create_credit_block('alice', 100))
+            for n in range(transactions):
+                await actor.execute(blockchain.add_transaction, 'alice', f'bob{n}', 1)
+            manager = ConnectionManager()
+            manager.share_difficulty = '0'
+            return await scenario(manager, actor, blockchain)
+        finally:
+            await actor.stop()
+    return asyncio.run(main())
+
+
+def first_nonce(blockchain, job, share: bool, block: bool) -> int:
+    for nonce in range(job['nonce_start'], job['nonce_end']):
+        hash_operation = blockchain.hash_with_nonce(job['prefix'], nonce)
+        if (blockchain.meets_difficulty(hash_operation, '0') == share
+                and blockchain.meets_difficulty(hash_operation) == block):
+            return nonce
+
+
+def only_job(manager, websocket) -> dict:
+    job, = manager.workers[websocket]['jobs'].values()
+    return job
+
+
+def test_workers_share_a_capped_template_with_disjoint_nonce_ranges():
+    async def scenario(manager, actor, blockchain):
+        manager.max_template_transactions = 2
+        first, second = object(), object()
+        await manager.subscribe(first, 'miner-a', blockchain, actor.snapshot)
+        await manager.subscribe(second, 'miner-b', blockchain, actor.snapshot)
+        a, b = only_job(manager, first), only_job(manager, second)
+
+        assert [tx['receiver'] for tx in a['template']['transactions']] == ['bob0', 'bob1']
+        assert a['template']['transactions'] is b['template']['transactions']
+        assert a['template']['balances'] == {'miner-a': blockchain.mining_reward}
+        assert a['nonce_end'] <= b['nonce_start']
+    run_pool(scenario)
+
+
+def test_check_share_verifies_each_submission():
+    async def scenario(manager, actor, blockchain):
+        miner = object()
+        await manager.subscribe(miner, 'miner', blockchain, actor.snapshot)
+        job = only_job(manager, miner)
+
+        def check(job_id, nonce):
+            return manager.check_share(miner, job_id, nonce, blockchain, actor.snapshot)
+
+        low, share = first_nonce(blockchain, job, False, False), first_nonce(blockchain, job, True, False)
+        assert check('missing', share) == ('unknown_job', None)
+        assert check(job['job_id'], job['nonce_end']) == ('out_of_range', None)
+        assert check(job['job_id'], low) == ('low_difficulty', None)
+        assert check(job['job_id'], share) == ('share', None)
+        assert check(job['job_id'], share) == ('duplicate', None)
+
+        result, block = check(job['job_id'], first_nonce(blockchain, job, True, True))
+        assert result == 'block'
+        assert await actor.execute(blockchain.append_block, block)
+        assert manager.workers[miner]['shares'] == 2
+        # The tip moved, so the old job can no longer produce a block.
+        assert check(job['job_id'], share + 1) == ('stale', None)
+    run_pool(scenario)
+
+
+def test_a_job_stops_accepting_shares_once_exhausted():
+    async def scenario(manager, actor, blockchain):
+        manager.max_shares_per_job = 1
+        miner = object()
+        await manager.subscribe(miner, 'miner', blockchain, actor.snapshot)
+        job = only_job(manager, miner)
+        shares = [nonce for nonce in range(job['nonce_start'], job['nonce_start'] + 200)
+                  if blockchain.hash_with_nonce(job['prefix'], nonce).startswith('0')][:2]
+
+        assert manager.check_share(miner, job['job_id'], shares[0], blockchain, actor.snapshot)[0] in ('share', 'block')
+        assert manager.check_share(miner, job['job_id'], shares[1], blockchain, actor.snapshot) == ('exhausted', None)
+    run_pool(scenario)
+
+
+def test_no_pending_transactions_means_no_job():
+    async def scenario(manager, actor, blockchain):
+        miner = object()
+        await manager.subscribe(miner, 'miner', blockchain, actor.snapshot)
+        assert manager.workers[miner]['jobs'] == {}
+    run_pool(scenario, transactions=0)